@@ -65,12 +65,8 @@ class MaterialBox(QGroupBox):
         """
         materials = QComboBox()
 
-        materials.addItem("Hardwood", mtl.HARDWOOD)
-        materials.addItem("Carpet", mtl.CARPET)
-        materials.addItem("Drywall", mtl.DRYWALL)
-        materials.addItem("Brick", mtl.BRICK)
-        materials.addItem("Concrete", mtl.CONCRETE)
-        materials.addItem("Foam", mtl.FOAM)
+        for m in range(mtl.count()):
+            materials.addItem(mtl.name(m), m)
 
         return materials
 
@@ -107,24 +103,16 @@ class MaterialBox(QGroupBox):
         the current frequency
         """
         sabine_table = QTableWidget()
-        sabine_table.setRowCount(6)
+        sabine_table.setRowCount(mtl.count())
         sabine_table.setColumnCount(2)
         sabine_table.setHorizontalHeaderLabels(["Material", "Absorption"])
 
-        materials = [
-            mtl.HARDWOOD,
-            mtl.CARPET,
-            mtl.DRYWALL,
-            mtl.BRICK,
-            mtl.CONCRETE,
-            mtl.FOAM,
-        ]
-
-        for i, m in enumerate(materials):
-            sabine_table.setItem(i, 0, QTableWidgetItem(mtl.name(m)))
-            a = QTableWidgetItem(str(mtl.absorption(m, freq)))
+        absorption = mtl.absorption(np.arange(mtl.count()), freq)
+        for m in range(mtl.count()):
+            sabine_table.setItem(m, 0, QTableWidgetItem(mtl.name(m)))
+            a = QTableWidgetItem(str(round(float(absorption[m]), 3)))
             a.setTextAlignment(Qt.AlignCenter)
-            sabine_table.setItem(i, 1, a)
+            sabine_table.setItem(m, 1, a)
 
         return sabine_table
 
@@ -167,14 +155,26 @@ class MaterialBox(QGroupBox):
         self.sabine_table.close()
         self.sabine_table = new_sabine_table
 
+    def update_materials(self, freq):
+        """
+        Updates the material dropdown and sabine table after materials were
+        loaded.
+        """
+        new_material_dropdown = self.create_material_dropdown()
+        self.material_changer_layout.replaceWidget(
+            self.material_dropdown, new_material_dropdown
+        )
+        self.material_dropdown.close()
+        self.material_dropdown = new_material_dropdown
+        self.update_freq(freq)
+
     @pyqtSlot()
     def set_material(self, face, mtl):
         """
         Changes the material of the specified face.
         """
         if face is None:
-            for face in self.model_faces:
-                face.material = mtl
+            self.model_faces.materials[:] = mtl
         else:
             face.material = mtl
         self.update_view.emit(self.material_view)
@@ -5,6 +5,7 @@ from PyQt5.QtWidgets import QAction, QMenuBar, QFileDialog
 class MenuBar(QMenuBar):
     open = pyqtSignal(str)
     save = pyqtSignal(str)
+    load_materials = pyqtSignal(str)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -23,6 +24,10 @@ class MenuBar(QMenuBar):
         open_action.setShortcut("Ctrl+O")
         open_action.triggered.connect(self.open_file)
         file_tab.addAction(open_action)
+        # Load Materials
+        materials_action = QAction("Load Materials...", self)
+        materials_action.triggered.connect(self.open_materials)
+        file_tab.addAction(materials_action)
         # Export
         export_action = QAction("Export...", self)
         export_action.setShortcut("Ctrl+E")
@@ -68,12 +73,26 @@ class MenuBar(QMenuBar):
         options = QFileDialog.Options()
         options |= QFileDialog.DontUseNativeDialog
         filename, _ = QFileDialog.getOpenFileName(
-            self, "Open File", "", "3D Files (*.obj)", options=options
+            self, "Open File", "", "3D Files (*.obj *.stl *.ply)", options=options
         )
 
         if filename:
             self.open.emit(filename)
 
+    @pyqtSlot()
+    def open_materials(self):
+        """
+        Opens the file dialog for the user to select a material library
+        """
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        filename, _ = QFileDialog.getOpenFileName(
+            self, "Load Materials", "", "Material Libraries (*.csv)", options=options
+        )
+
+        if filename:
+            self.load_materials.emit(filename)
+
     @pyqtSlot()
     def save_file(self):
         """
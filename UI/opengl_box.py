@@ -1,18 +1,23 @@
+import math
 from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtWidgets import QGroupBox, QHBoxLayout, QLayout
 
 from gl_widget import GLWidget
 from geometry.vec3 import Vec3
-from geometry.face import Face
+from geometry.face_table import FaceTable
 import formulas.db_formulas as db
 
 
 class OpenGLBox(QGroupBox):
     update_stat_box = pyqtSignal(Vec3)
+    trace_progress = pyqtSignal(int, int, float, float)
+    trace_finished = pyqtSignal(bool, bool, float)
 
     def __init__(self, str, parent=None):
         super().__init__(str)
         self.gl_widget = GLWidget()
+        self.gl_widget.trace_progress.connect(self.trace_progress)
+        self.gl_widget.trace_finished.connect(self.trace_finished)
         layout = QHBoxLayout()
         layout.addWidget(self.gl_widget)
         self.setLayout(layout)
@@ -25,7 +30,7 @@ class OpenGLBox(QGroupBox):
 
         self.update_stat_box.emit(self.gl_widget.object_center)
 
-    def get_model_faces(self) -> [Face]:
+    def get_model_faces(self) -> FaceTable:
         return self.gl_widget.object_faces
 
     def update_sound_source(self, x: float, y: float, z: float):
@@ -40,17 +45,40 @@ class OpenGLBox(QGroupBox):
         """
         self.gl_widget.run_raytracer(start_db=start_db, freq=freq, reflections=r_num)
 
-    def calc_rt60(self) -> float:
+    def update_db_map(self, start_db=None, freq=None):
         """
-        Calculates the RT60 value of the model.
+        Updates the decibel map of the model for material, frequency or start level
+        changes without raytracing it again.
         """
-        return db.rt60(self.gl_widget.object_volume, self.gl_widget.object_faces,)
+        self.gl_widget.update_raytracer(start_db=start_db, freq=freq)
 
-    def calc_crit_dist(self) -> float:
+    def cancel_db_map(self):
         """
-        Calculates the Critical Distance value of the model.
+        Stops calculating the decibel map of the model.
         """
-        return db.crit_dist(self.gl_widget.object_volume, self.gl_widget.object_faces,)
+        self.gl_widget.cancel_raytracer()
+
+    def calc_rt60(self, freq: int) -> tuple:
+        """
+        Calculates the RT60 value of the model at the given frequency. The T30 of
+        the traced decibel map is used when its decay tail is usable, otherwise it
+        is estimated from the materials with the Sabine formula.
+        Returns the value and the name of the method used.
+        """
+        raytracer = self.gl_widget.raytracer
+        if raytracer and not self.gl_widget.updating() and raytracer.freq == freq:
+            reverb = raytracer.reverberation()
+            if not math.isnan(reverb):
+                return reverb, "traced T30"
+        volume, faces = self.gl_widget.object_volume, self.gl_widget.object_faces
+        return db.rt60(volume, faces, freq), "Sabine"
+
+    def calc_crit_dist(self, freq: int) -> float:
+        """
+        Calculates the Critical Distance value of the model at the given frequency.
+        """
+        volume, faces = self.gl_widget.object_volume, self.gl_widget.object_faces
+        return db.crit_dist(volume, faces, freq)
 
     def update_view(self, material_view):
         """
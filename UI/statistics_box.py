@@ -20,7 +20,9 @@ import numpy as np
 class StatBox(QGroupBox):
     update_sound_source = pyqtSignal(float, float, float)
     update_freq = pyqtSignal(int)
+    update_start_db = pyqtSignal(int)
     calc_db_map = pyqtSignal(int, int)
+    cancel_db_map = pyqtSignal()
     calc_rt60 = pyqtSignal(QLineEdit)
     calc_crit_dist = pyqtSignal(QLineEdit)
 
@@ -136,6 +138,10 @@ class StatBox(QGroupBox):
         db_map_btn.setToolTip("Generates Decibel Map")
         db_map_btn.clicked.connect(self.dB_map)
 
+        db_map_cancel_btn = QPushButton("Cancel")
+        db_map_cancel_btn.setToolTip("Stops generating the Decibel Map")
+        db_map_cancel_btn.clicked.connect(self.cancel_db_map)
+
         db_map_info_btn = QPushButton("View Details")
         db_map_info_btn.setToolTip("View details of the Decibel Map calculation")
         db_map_info_btn.clicked.connect(self.decibel_info)
@@ -151,6 +157,7 @@ class StatBox(QGroupBox):
         db_map_btn_layout.addWidget(reflection_select, 2, 1, 1, 1)
         db_map_btn_layout.addWidget(db_map_btn, 3, 0, 1, 1)
         db_map_btn_layout.addWidget(db_map_info_btn, 3, 1, 1, 1)
+        db_map_btn_layout.addWidget(db_map_cancel_btn, 4, 0, 1, 2)
 
         layout.addWidget(db_map_label)
         layout.addLayout(db_map_btn_layout)
@@ -261,6 +268,7 @@ class StatBox(QGroupBox):
         state, _, _ = QIntValidator(0, 120).validate(input.text(), 0)
         if state == QValidator.Acceptable:
             self.start_db = int(input.text())
+            self.update_start_db.emit(self.start_db)
         else:
             input.setText("0")
 
@@ -0,0 +1,71 @@
+import math
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from raytracing.raytracer import RayTracer
+
+
+class TraceThread(QThread):
+    """
+    Raytraces the model off the GUI thread\n
+    A snapshot of the points is emitted about every `step` rays, reflections
+    included, so the decibel map can be shown while it is being calculated, along
+    with the error of the map when it is traced until it converges. The trace
+    stops early once an interruption is requested, also in the middle of a step.
+    """
+
+    progress = pyqtSignal(int, int, float, float)
+    partial = pyqtSignal(object)
+
+    def __init__(self, step: int, *args, parent=None, **kwargs):
+        super().__init__(parent)
+        self.step = step
+        self.args = args
+        self.kwargs = kwargs
+        self.raytracer = None
+
+    def run(self):
+        """
+        Builds the raytracer and traces its rays step by step
+        """
+        start = time.time()
+        self.raytracer = RayTracer(*self.args, run=False, **self.kwargs)
+        self.raytracer.stop = self.isInterruptionRequested
+        total = self.raytracer.ray_num
+
+        step = self.raytracer.step_size(self.step)
+        for done in self.raytracer.run_steps(step):
+            if self.isInterruptionRequested():
+                return
+
+            # Estimated time remaining, assuming the remaining rays cost the same
+            elapsed = time.time() - start
+            remaining = elapsed / done * (total - done)
+            if self.raytracer.time_budget is not None:
+                remaining = min(remaining, max(self.raytracer.time_budget - elapsed, 0))
+            error = self.raytracer.error
+            error = math.nan if error is None else error
+
+            self.partial.emit(self.raytracer.points())
+            self.progress.emit(done, total, remaining, error)
+
+
+class UpdateThread(QThread):
+    """
+    Re-evaluates a finished decibel map off the GUI thread\n
+    The raytracer is updated in place from its recorded paths, it should not be
+    used until the thread has finished.
+    """
+
+    def __init__(self, raytracer, start_db=None, freq=None, parent=None):
+        super().__init__(parent)
+        self.raytracer = raytracer
+        self.start_db = start_db
+        self.freq = freq
+
+    def run(self):
+        """
+        Recalculates the decibel map for the given start level and frequency
+        """
+        self.raytracer.reevaluate(start_db=self.start_db, freq=self.freq)
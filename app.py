@@ -18,6 +18,7 @@ from UI.menu_bar import MenuBar
 from UI.opengl_box import OpenGLBox
 from UI.statistics_box import StatBox
 from UI.material_box import MaterialBox
+from geometry.materials import Materials as mtl
 
 
 class App(QMainWindow):
@@ -50,13 +51,18 @@ class App(QMainWindow):
         self.setMenuBar(self.menu_bar)
         self.menu_bar.open.connect(self.load_model)
         self.menu_bar.save.connect(self.save_model)
+        self.menu_bar.load_materials.connect(self.load_materials)
         # self.createOpenGLBox()
         self.opengl_box = OpenGLBox("Modelview")
+        self.opengl_box.trace_progress.connect(self.update_trace_progress)
+        self.opengl_box.trace_finished.connect(self.trace_finished)
         # self.createStatBox()
         self.stat_box = StatBox("Acoustic Calculations", parent=self)
         self.stat_box.update_sound_source.connect(self.update_sound_source)
         self.stat_box.update_freq.connect(self.update_freq)
+        self.stat_box.update_start_db.connect(self.update_start_db)
         self.stat_box.calc_db_map.connect(self.calc_db_map)
+        self.stat_box.cancel_db_map.connect(self.cancel_db_map)
         self.stat_box.calc_rt60.connect(self.calc_rt60)
         self.stat_box.calc_crit_dist.connect(self.calc_crit_dist)
         # self.createTreatmentBox()
@@ -112,11 +118,34 @@ class App(QMainWindow):
         """
         Signaled when a file is selected to be loaded.
         """
-        self.opengl_box.load_model(filename)
+        try:
+            self.opengl_box.load_model(filename)
+        except (OSError, ValueError) as error:
+            message = "Could not load {}: {}".format(filename, error)
+            self.statusBar().showMessage(message)
+            return
         model_faces = self.opengl_box.get_model_faces()
         self.material_box.update_material_box(model_faces, self.freq)
         self.model_loaded = True
 
+    @pyqtSlot(str)
+    def load_materials(self, filename):
+        """
+        Signaled when a material library is selected to be loaded.
+        """
+        try:
+            mtl.load(filename)
+        except (OSError, ValueError) as error:
+            message = "Could not load {}: {}".format(filename, error)
+            self.statusBar().showMessage(message)
+            return
+        self.material_box.update_materials(self.freq)
+
+        # Loaded materials may replace the colors and coefficients of materials
+        # the model already uses
+        if self.model_loaded:
+            self.update_view(self.material_box.material_view)
+
     @pyqtSlot(str)
     def save_model(self, filename):
         """
@@ -149,6 +178,14 @@ class App(QMainWindow):
         """
         self.freq = freq
         self.material_box.update_freq(freq)
+        self.opengl_box.update_db_map(freq=freq)
+
+    @pyqtSlot(int)
+    def update_start_db(self, start_db: int):
+        """
+        Signaled when the starting decibel level field is updated.
+        """
+        self.opengl_box.update_db_map(start_db=start_db)
 
     @pyqtSlot(int, int)
     def calc_db_map(self, start_db: int, r_num: int):
@@ -158,14 +195,52 @@ class App(QMainWindow):
         """
         self.opengl_box.calc_db_map(start_db, self.freq, r_num)
 
+    @pyqtSlot()
+    def cancel_db_map(self):
+        """
+        Signaled when the cancel button is clicked to stop rendering the
+        decibel map of the model.
+        """
+        self.opengl_box.cancel_db_map()
+
+    @pyqtSlot(int, int, float, float)
+    def update_trace_progress(
+        self, done: int, total: int, remaining: float, error: float
+    ):
+        """
+        Signaled when more rays of the decibel map have been traced.
+        """
+        message = "Tracing rays: {} / {} ({:.0f}%), about {:.0f}s remaining".format(
+            done, total, 100 * done / total, remaining
+        )
+        if not np.isnan(error):
+            message += ", error {:.1f} dB".format(error)
+        self.statusBar().showMessage(message)
+
+    @pyqtSlot(bool, bool, float)
+    def trace_finished(self, cancelled: bool, converged: bool, error: float):
+        """
+        Signaled when the decibel map is done, has been cancelled or has run out of
+        rays or time before reaching its target error.
+        """
+        if cancelled:
+            message = "Decibel map cancelled"
+        elif converged:
+            message = "Decibel map done, error {:.1f} dB".format(error)
+        elif np.isfinite(error):
+            message = "Decibel map stopped unconverged, error {:.1f} dB".format(error)
+        else:
+            message = "Decibel map stopped unconverged, error unknown"
+        self.statusBar().showMessage(message)
+
     @pyqtSlot(QLineEdit)
     def calc_rt60(self, out):
         """
         Signaled when the calculate button is clicked to determine 
         the RT60 value of the model.
         """
-        reverb = self.opengl_box.calc_rt60()
-        out.setText(str(np.round(reverb, 3)))
+        reverb, method = self.opengl_box.calc_rt60(self.freq)
+        out.setText("{} ({})".format(np.round(reverb, 3), method))
 
     @pyqtSlot(QLineEdit)
     def calc_crit_dist(self, out):
@@ -173,7 +248,7 @@ class App(QMainWindow):
         Signaled when the calculate button is clicked to determine 
         the Critical Distance value of the model.
         """
-        crit_dist = self.opengl_box.calc_crit_dist()
+        crit_dist = self.opengl_box.calc_crit_dist(self.freq)
         out.setText(str(np.round(crit_dist, 3)))
 
     @pyqtSlot(bool)
@@ -183,6 +258,7 @@ class App(QMainWindow):
         material view checkbox is clicked.
         """
         self.opengl_box.update_view(material_view)
+        self.opengl_box.update_db_map()
 
 
 if __name__ == "__main__":
@@ -1,81 +1,265 @@
+from array import array
+import hashlib
+import json
+import os
 import OpenGL.GL as gl
 import numpy as np
 
-from geometry.vec3 import Vec3
-from geometry.face import Face
+from geometry.face_table import FaceTable, save_array
 from geometry.materials import Materials as mtl
 
 
-class ObjLoader:
-    def __init__(self, fileName):
-        self.vertices = np.empty((0), dtype=Vec3)
-        self.normals = np.empty((0), dtype=Vec3)
-        self.faces = np.empty((0), dtype=Face)
+# Characters of an .obj file read at a time
+CHUNK_SIZE = 1 << 22
+# Suffix of the directory the binary mesh of a model is cached in
+CACHE_SUFFIX = ".cache"
+# Version of the cache layout, older caches are rebuilt
+CACHE_VERSION = 2
 
-        # Parse file and construct list of vertices, faces, and face normals
+# Size of the header of a binary .stl file and the record of each triangle
+STL_HEADER = 84
+STL_TRIANGLE = np.dtype(
+    [("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")]
+)
+
+# NumPy types of the property types of .ply files
+PLY_TYPES = {
+    "char": "i1",
+    "int8": "i1",
+    "uchar": "u1",
+    "uint8": "u1",
+    "short": "i2",
+    "int16": "i2",
+    "ushort": "u2",
+    "uint16": "u2",
+    "int": "i4",
+    "int32": "i4",
+    "uint": "u4",
+    "uint32": "u4",
+    "float": "f4",
+    "float32": "f4",
+    "double": "f8",
+    "float64": "f8",
+}
+# Names of the .ply face property listing the corners
+PLY_CORNERS = ("vertex_indices", "vertex_index")
+
+
+def file_hash(fileName) -> str:
+    """
+    SHA-1 digest of the contents of a file
+    """
+    digest = hashlib.sha1()
+    with open(fileName, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_floats(lines: list, width: int) -> np.ndarray:
+    """
+    Parses the first `width` numbers of every line into a (lines, width) array\n
+    Lines of exactly `width` numbers are parsed in a single call, any other
+    line makes the whole batch fall back to splitting each line.
+    """
+    if not lines:
+        return np.empty((0, width))
+    try:
+        values = np.fromstring(" ".join(lines), sep=" ")
+    except ValueError:
+        values = None
+    if values is not None and len(values) == width * len(lines):
+        return values.reshape(-1, width)
+    return np.array([line.split()[:width] for line in lines], dtype=float)
+
+
+def parse_corners(line: str, vertex_count: int, normal_count: int) -> tuple:
+    """
+    Parses the `v`, `v/vt`, `v//vn` or `v/vt/vn` corners of a face line into
+    zero-based vertex and normal indices\n
+    Negative indices count back from the last vertex or normal read so far,
+    corners without a normal get -1.
+    """
+    vertices = []
+    normals = []
+    for corner in line.split()[1:]:
+        refs = corner.split("/")
+        v = int(refs[0])
+        vertices.append(v - 1 if v > 0 else vertex_count + v)
+        if len(refs) > 2 and refs[2]:
+            n = int(refs[2])
+            normals.append(n - 1 if n > 0 else normal_count + n)
+        else:
+            normals.append(-1)
+    return vertices, normals
+
+
+def average_normals(normals: np.ndarray, normal_indices: np.ndarray) -> np.ndarray:
+    """
+    Face normals pointing against the mean of the vertex normals of the corners
+    of each face, not a number where a corner has no normal
+    """
+    face_normals = np.full((len(normal_indices), 3), np.nan)
+    known = ((normal_indices >= 0) & (normal_indices < len(normals))).all(axis=1)
+    face_normals[known] = -(normals[normal_indices[known]].sum(axis=1) / 3)
+    return face_normals
+
+
+def fan_triangles(corners: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Splits polygons into fans of triangles\n
+    `corners` holds the vertex indices of all polygons one after the other and
+    `counts` the number of corners of each polygon. Returns (triangles, 3)
+    vertex indices.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    fans = np.maximum(counts - 2, 0)
+    polygon = np.repeat(np.arange(len(counts)), fans)
+    k = np.arange(len(polygon)) - np.repeat(np.cumsum(fans) - fans, fans) + 1
+    first = starts[polygon]
+    return np.stack(
+        [corners[first], corners[first + k], corners[first + k + 1]], axis=1
+    ).astype(np.int64)
+
+
+def read_ply_header(file) -> tuple:
+    """
+    Reads the header of a .ply file\n
+    Returns the format, the elements as (name, count, properties) and the size
+    of the header. Scalar properties are (name, type), list properties are
+    (name, count type, item type).
+    """
+    if file.readline().strip() != b"ply":
+        raise ValueError("Not a .ply file")
+    ply_format = None
+    elements = []
+    for line in file:
+        words = line.decode("ascii").split()
+        if not words:
+            continue
+        if words[0] == "format":
+            ply_format = words[1]
+        elif words[0] == "element":
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == "property" and words[1] == "list":
+            elements[-1][2].append((words[4], words[2], words[3]))
+        elif words[0] == "property":
+            elements[-1][2].append((words[2], words[1]))
+        elif words[0] == "end_header":
+            return ply_format, elements, file.tell()
+    raise ValueError("The .ply header has no end")
+
+
+def ply_dtype(order: str, properties: list, length=None) -> np.dtype:
+    """
+    Record type of a .ply element, lists are taken to hold `length` items
+    """
+    fields = []
+    for prop in properties:
+        if len(prop) == 3:
+            if length is None:
+                raise ValueError("Elements with lists need a list length")
+            fields.append((prop[0] + "_count", order + PLY_TYPES[prop[1]]))
+            fields.append((prop[0], order + PLY_TYPES[prop[2]], (length,)))
+        else:
+            fields.append((prop[0], order + PLY_TYPES[prop[1]]))
+    return np.dtype(fields)
+
+
+class MeshLoader:
+    """
+    Loads a model file into a `FaceTable`\n
+    Subclasses parse one file format into `vertices`, vertex `normals` and
+    `faces`, parsed models are cached as memory-mapped arrays next to the file.
+    """
+
+    def __init__(self, fileName, cache=True):
+        """
+        Loads a model, from its binary cache when the cache is up to date\n
+        Parsed models are cached next to the file, unless `cache` is False.
+        Raises OSError when the file cannot be read and ValueError when it holds
+        no valid model.
+        """
+        if cache and self.load_cache(fileName):
+            return
+        self.parse(fileName)
+        if len(self.faces) == 0:
+            raise ValueError("No faces in {}".format(fileName))
+        if cache:
+            self.save_cache(fileName)
+
+    def parse(self, fileName):
+        """
+        Reads the mesh of a model file
+        """
+        raise NotImplementedError
+
+    def cache_key(self, fileName, digest=None) -> dict:
+        """
+        Identifies the contents of a model file by its size, modification time
+        and hash
+        """
+        stat = os.stat(fileName)
+        return {
+            "version": CACHE_VERSION,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": digest or file_hash(fileName),
+        }
+
+    def load_cache(self, fileName) -> bool:
+        """
+        Memory-maps the cached mesh of a model file, returns whether the cache
+        was up to date\n
+        A cache with a different modification time is still used when the hash
+        of the file matches, and its key is updated.
+        """
+        directory = fileName + CACHE_SUFFIX
         try:
-            file = open(fileName)
-            for line in file:
-                if line.startswith("v "):
-                    line = line.strip().split()
-                    vertex = Vec3(line[1], line[2], line[3])
-
-                    self.vertices = np.append(self.vertices, vertex)
-
-                elif line.startswith("vn"):
-                    line = line.strip().split()
-                    normal = Vec3(line[1], line[2], line[3])
-
-                    self.normals = np.append(self.normals, normal)
-
-                elif line.startswith("f"):
-                    if "/" in line:
-                        line = line.strip().split()
-                        faceData = [
-                            line[1].split("/"),
-                            line[2].split("/"),
-                            line[3].split("/"),
-                        ]
-                        vertRef = [
-                            int(faceData[0][0]),
-                            int(faceData[1][0]),
-                            int(faceData[2][0]),
-                        ]
-                        vertices = np.array(
-                            [
-                                self.vertices[vertRef[0] - 1],
-                                self.vertices[vertRef[1] - 1],
-                                self.vertices[vertRef[2] - 1],
-                            ]
-                        )
-                        # Calculate face normal using vertex normals
-                        faceNorm = None
-                        if len(self.normals) > 0:
-                            faceNorm = (
-                                np.sum(
-                                    np.array(
-                                        [
-                                            self.normals[int(faceData[0][2]) - 1].vec,
-                                            self.normals[int(faceData[1][2]) - 1].vec,
-                                            self.normals[int(faceData[2][2]) - 1].vec,
-                                        ],
-                                        dtype=float,
-                                    ),
-                                    axis=0,
-                                )
-                                / 3
-                            )
-                            faceNorm = Vec3(*(-faceNorm))
-                    else:
-                        line = line.strip().split()
-                        vertices = (int(line[1]), int(line[2]), int(line[3]))
-                        faceNorm = Vec3(0, 0, 0)
+            with open(os.path.join(directory, "key.json")) as file:
+                key = json.load(file)
+            stat = os.stat(fileName)
+            if key.get("version") != CACHE_VERSION or key.get("size") != stat.st_size:
+                return False
+            if key.get("mtime") != stat.st_mtime_ns:
+                if key.get("hash") != file_hash(fileName):
+                    return False
+                self.write_key(directory, self.cache_key(fileName, key["hash"]))
 
-                    self.faces = np.append(self.faces, Face(vertices, faceNorm))
+            self.faces = FaceTable.load(directory)
+            self.vertices = self.faces.vertices
+            self.normals = np.load(os.path.join(directory, "vertex_normals.npy"))
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
 
-            file.close()
-        except IOError:
-            print(".obj file not found.")
+    def save_cache(self, fileName):
+        """
+        Writes the parsed mesh next to the model file, skipped when the
+        directory cannot be written to
+        """
+        directory = fileName + CACHE_SUFFIX
+        try:
+            key = self.cache_key(fileName)
+            # The key is written last, so an interrupted write leaves no valid cache
+            if os.path.exists(os.path.join(directory, "key.json")):
+                os.remove(os.path.join(directory, "key.json"))
+            self.faces.save(directory)
+            save_array(os.path.join(directory, "vertex_normals.npy"), self.normals)
+            self.write_key(directory, key)
+        except OSError:
+            pass
+
+    def write_key(self, directory, key: dict):
+        """
+        Stores the key of a cached mesh, replacing the previous key whole
+        """
+        path = os.path.join(directory, "key.json")
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp, "w") as file:
+            json.dump(key, file)
+        os.replace(temp, path)
 
     def render(self, material_view=False):
         """
@@ -91,11 +275,241 @@ class ObjLoader:
             gl.glNewList(gl_list, gl.GL_COMPILE)
             gl.glPolygonMode(gl.GL_FRONT_AND_BACK, polygon_mode)
             gl.glBegin(gl.GL_TRIANGLES)
-            for face in self.faces:
-                for vertex in face.vertices:
-                    vertexDraw = vertex.vec
-                    gl.glColor4fv(mtl.color(face.material))
-                    gl.glVertex3fv(vertexDraw)
+            colors = {m: mtl.color(m) for m in np.unique(self.faces.materials)}
+            for corners, material in zip(self.faces.corners(), self.faces.materials):
+                gl.glColor4fv(colors[material])
+                for vertex in corners:
+                    gl.glVertex3fv(vertex)
             gl.glEnd()
             gl.glEndList()
         return gl_list
+
+
+class ObjLoader(MeshLoader):
+    """
+    Loads Wavefront .obj models
+    """
+
+    def parse(self, fileName):
+        """
+        Parses the vertices, vertex normals and faces of an .obj file
+        """
+        vertices = []
+        normals = []
+        indices = array("q")
+        normal_indices = array("q")
+        vertex_count = 0
+        normal_count = 0
+
+        # Stream the file in chunks, collecting the vertex and normal lines of each
+        # chunk for bulk parsing and the triangulated face indices in flat buffers
+        with open(fileName) as file:
+            rest = ""
+            while True:
+                chunk = file.read(CHUNK_SIZE)
+                lines = (rest + chunk).split("\n")
+                rest = lines.pop() if chunk else ""
+                vertex_lines = []
+                normal_lines = []
+                for line in lines:
+                    if line.startswith(("v ", "v\t")):
+                        vertex_lines.append(line[2:])
+                    elif line.startswith(("vn ", "vn\t")):
+                        normal_lines.append(line[3:])
+                    elif line.startswith(("f ", "f\t")):
+                        corners, corner_normals = parse_corners(
+                            line,
+                            vertex_count + len(vertex_lines),
+                            normal_count + len(normal_lines),
+                        )
+                        # Split quads and n-gons into a fan of triangles
+                        for k in range(1, len(corners) - 1):
+                            indices.extend(corners[:1] + corners[k : k + 2])
+                            normal_indices.extend(
+                                corner_normals[:1] + corner_normals[k : k + 2]
+                            )
+
+                vertices.append(parse_floats(vertex_lines, 3))
+                normals.append(parse_floats(normal_lines, 3))
+                vertex_count += len(vertex_lines)
+                normal_count += len(normal_lines)
+                if not chunk:
+                    break
+
+        self.vertices = np.concatenate(vertices or [np.empty((0, 3))])
+        self.normals = np.concatenate(normals or [np.empty((0, 3))])
+        indices = np.frombuffer(indices, dtype=np.int64).reshape(-1, 3)
+        normal_indices = np.frombuffer(normal_indices, dtype=np.int64).reshape(-1, 3)
+
+        self.faces = FaceTable(
+            self.vertices, indices, average_normals(self.normals, normal_indices)
+        )
+
+
+class StlLoader(MeshLoader):
+    """
+    Loads binary and ASCII .stl models
+    """
+
+    def parse(self, fileName):
+        """
+        Maps the triangles of a binary .stl file, or parses an ASCII one\n
+        Corners at the same position are merged into one vertex. Face normals
+        point against the stored facet normals like those of .obj models, facets
+        without a normal get the normal of their winding.
+        """
+        with open(fileName, "rb") as file:
+            header = file.read(STL_HEADER)
+            start = header + file.read(1024)
+        text = start.lstrip().startswith(b"solid") and b"facet" in start
+
+        # ASCII files start with "solid" followed by facets, binary files hold at
+        # least the triangles their header counts, some with padding after them
+        if text:
+            with open(fileName) as file:
+                lines = [line.strip() for line in file]
+            vertex_lines = [line[6:] for line in lines if line.startswith("vertex")]
+            normal_lines = [line[12:] for line in lines if line.startswith("facet")]
+            corners = parse_floats(vertex_lines, 3).reshape(-1, 3, 3)
+            facet_normals = parse_floats(normal_lines, 3)
+        else:
+            if len(header) < STL_HEADER:
+                raise ValueError("Not a valid .stl file: {}".format(fileName))
+            count = int(np.frombuffer(header, "<u4", 1, 80)[0])
+            if os.path.getsize(fileName) < STL_HEADER + count * STL_TRIANGLE.itemsize:
+                raise ValueError("Truncated .stl file: {}".format(fileName))
+            corners = np.empty((0, 3, 3))
+            facet_normals = np.empty((0, 3))
+            if count > 0:
+                triangles = np.memmap(fileName, STL_TRIANGLE, "r", STL_HEADER, (count,))
+                corners = triangles["vertices"]
+                facet_normals = triangles["normal"]
+
+        self.vertices, indices = np.unique(
+            np.asarray(corners, dtype=float).reshape(-1, 3),
+            axis=0,
+            return_inverse=True,
+        )
+        self.normals = np.empty((0, 3))
+
+        face_normals = -np.asarray(facet_normals, dtype=float)
+        face_normals[~face_normals.any(axis=1)] = np.nan
+        self.faces = FaceTable(self.vertices, indices.reshape(-1, 3), face_normals)
+
+
+class PlyLoader(MeshLoader):
+    """
+    Loads binary .ply models
+    """
+
+    def parse(self, fileName):
+        """
+        Maps the vertex and face elements of a binary .ply file\n
+        Faces with the same number of corners are mapped in one go, files mixing
+        polygons are read face by face. Polygons are split into fans of
+        triangles. Face normals point against the mean of the vertex normals
+        like those of .obj models, without vertex normals they are calculated
+        from the winding.
+        """
+        vertices = np.empty((0, 3))
+        normals = np.empty((0, 3))
+        indices = np.empty((0, 3), dtype=np.int64)
+        with open(fileName, "rb") as file:
+            ply_format, elements, offset = read_ply_header(file)
+        if ply_format not in ("binary_little_endian", "binary_big_endian"):
+            raise ValueError("Only binary .ply files are supported")
+        order = "<" if ply_format == "binary_little_endian" else ">"
+
+        for name, count, properties in elements:
+            if name == "vertex":
+                data, offset = self.read_element(
+                    fileName, order, properties, count, offset
+                )
+                vertices = np.stack([data["x"], data["y"], data["z"]], axis=1)
+                if "nz" in data.dtype.names:
+                    normals = np.stack([data["nx"], data["ny"], data["nz"]], axis=1)
+            elif name == "face":
+                indices, offset = self.read_faces(
+                    fileName, order, properties, count, offset
+                )
+            elif any(len(prop) == 3 for prop in properties):
+                # Other elements with lists cannot be skipped without reading
+                break
+            else:
+                _, offset = self.read_element(
+                    fileName, order, properties, count, offset
+                )
+
+        self.vertices = np.asarray(vertices, dtype=float)
+        self.normals = np.asarray(normals, dtype=float)
+        normal_indices = indices if len(self.normals) else np.full_like(indices, -1)
+        self.faces = FaceTable(
+            self.vertices, indices, average_normals(self.normals, normal_indices)
+        )
+
+    def read_element(self, fileName, order, properties, count, offset, length=None):
+        """
+        Maps `count` records of an element without lists, or with lists of
+        `length` items. Returns the records and the offset after them.
+        """
+        dtype = ply_dtype(order, properties, length)
+        if count == 0:
+            return np.zeros(0, dtype), offset
+        data = np.memmap(fileName, dtype, "r", offset, (count,))
+        return data, offset + count * dtype.itemsize
+
+    def read_faces(self, fileName, order, properties, count, offset) -> tuple:
+        """
+        Reads the triangulated corners of the faces, returns them and the offset
+        after the face element
+        """
+        corners = next(prop for prop in properties if prop[0] in PLY_CORNERS)
+
+        # Triangle and quad meshes are mapped directly
+        for length in (3, 4):
+            try:
+                data, end = self.read_element(
+                    fileName, order, properties, count, offset, length
+                )
+            except ValueError:
+                continue
+            lists = [prop[0] for prop in properties if len(prop) == 3]
+            if all(np.all(data[name + "_count"] == length) for name in lists):
+                polygons = np.asarray(data[corners[0]], dtype=np.int64)
+                return fan_triangles(polygons.reshape(-1), [length] * count), end
+
+        # Other meshes are walked face by face
+        with open(fileName, "rb") as file:
+            file.seek(offset)
+            buffer = file.read()
+        position = 0
+        polygons = []
+        for _ in range(count):
+            for prop in properties:
+                if len(prop) == 2:
+                    position += np.dtype(PLY_TYPES[prop[1]]).itemsize
+                    continue
+                count_type = np.dtype(order + PLY_TYPES[prop[1]])
+                item_type = np.dtype(order + PLY_TYPES[prop[2]])
+                items = int(np.frombuffer(buffer, count_type, 1, position)[0])
+                position += count_type.itemsize
+                if prop is corners:
+                    polygons.append(np.frombuffer(buffer, item_type, items, position))
+                position += items * item_type.itemsize
+        counts = [len(polygon) for polygon in polygons]
+        flat = np.concatenate(polygons or [np.empty(0)]).astype(np.int64)
+        return fan_triangles(flat, counts), offset + position
+
+
+# Loader of each model file extension
+LOADERS = {".obj": ObjLoader, ".stl": StlLoader, ".ply": PlyLoader}
+
+
+def load_mesh(fileName, cache=True) -> MeshLoader:
+    """
+    Loads a model with the loader of its file extension
+    """
+    extension = os.path.splitext(fileName)[1].lower()
+    if extension not in LOADERS:
+        raise ValueError("Unsupported model file: {}".format(fileName))
+    return LOADERS[extension](fileName, cache)
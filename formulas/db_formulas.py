@@ -1,67 +1,174 @@
 import math
-from colorsys import hsv_to_rgb
+import numpy as np
 from geometry.materials import Materials as mtl
 
 
 def drop_off(dist_1, dist_2):
     """
-    Calculates the decibel level change between two distances
+    Calculates the decibel level change between two distances\n
+    Arrays of distances give the change of each pair.
     """
-    if dist_1 <= 0 or dist_2 <= 0:
+    dist_1 = np.asarray(dist_1, dtype=float)
+    dist_2 = np.asarray(dist_2, dtype=float)
+    if np.any(dist_1 <= 0) or np.any(dist_2 <= 0):
         raise Exception("Distances from source cannot be 0")
 
-    db_change = 20 * math.log10(dist_2 / dist_1)
-    return db_change
+    db_change = 20 * np.log10(dist_2 / dist_1)
+    return float(db_change) if db_change.ndim == 0 else db_change
 
 
-def sum_levels(levels):
+def db_to_intensity(levels):
     """
-    Sums multiple sound levels
+    Converts dB levels to sound intensities relative to 0dB\n
+    Levels at or below 0dB, and levels that are not a number, carry no intensity.
     """
-    if len(levels) == 0:
-        return 0
+    levels = np.asarray(levels, dtype=float)
+    intensity = np.zeros(levels.shape)
+    loud = levels > 0
+    intensity[loud] = 10 ** (levels[loud] / 10)
+    return intensity
 
-    sum_level = 0.0
-    for level in levels:
-        if level > 0:
-            sum_level += math.pow(10, float(level) / 10)
 
-    return 10 * math.log10(sum_level) if sum_level > 0 else 0
+def intensity_to_db(intensity):
+    """
+    Converts sound intensities relative to 0dB back to dB levels, no intensity
+    is 0dB
+    """
+    intensity = np.asarray(intensity, dtype=float)
+    levels = np.zeros(intensity.shape)
+    np.log10(intensity, out=levels, where=intensity > 0)
+    return 10 * levels
+
+
+def sum_levels(levels, axis=None):
+    """
+    Sums multiple sound levels\n
+    Levels are summed as intensities and converted back to dB once. Only levels
+    above 0dB add to the sum. Arrays are summed along `axis`, or entirely when
+    no axis is given.
+    """
+    total = intensity_to_db(db_to_intensity(levels).sum(axis=axis))
+    return float(total) if total.ndim == 0 else total
 
 
-def rt60(volume, faces) -> float:
+def rt60(volume, faces, freq=1000) -> float:
     """
     Reverberation time of the room denoted by the given faces\n
+    Estimated with the Sabine formula from the absorption at the given frequency.
     """
-    a_sum = 0
-    for face in faces:
-        a_sum += face.surface_area * mtl.absorption(face.material, 1000)
+    a_sum = np.sum(faces.areas * mtl.absorption(faces.materials, freq))
     reverb = 0.161 * (volume / a_sum)
 
     return reverb
 
 
-def crit_dist(volume, faces):
+def crit_dist(volume, faces, freq=1000):
     """
     Critical distance from the sound source
     - Volume is in cubic meters
     """
-    reverb = rt60(volume, faces)
+    reverb = rt60(volume, faces, freq)
     critical = 0.057 * math.sqrt(volume / reverb)
     return critical
 
 
+def schroeder(energy):
+    """
+    Schroeder backward integration of an energy histogram\n
+    Returns the decay curve in dB below the total energy, of the bins along the
+    first axis of `energy`. Bins after the last arrival are -inf.
+    """
+    energy = np.asarray(energy, dtype=float)
+    remaining = np.cumsum(energy[::-1], axis=0)[::-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 10 * np.log10(remaining / remaining[:1])
+
+
+def decay_time(times, curve, start, stop):
+    """
+    Time a decay curve takes to drop by 60dB, extrapolated from a least squares
+    fit of its samples between `start` and `stop` dB\n
+    Not a number when fewer than two samples fall in the range.
+    """
+    curve = np.asarray(curve, dtype=float)
+    times = np.asarray(times, dtype=float).reshape((-1,) + (1,) * (curve.ndim - 1))
+    fit = (curve <= start) & (curve >= stop)
+    count = fit.sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_t = np.where(fit, times, 0).sum(axis=0) / count
+        mean_c = np.where(fit, curve, 0).sum(axis=0) / count
+        dt = np.where(fit, times - mean_t, 0)
+        dc = np.where(fit, curve - mean_c, 0)
+        slope = (dt * dc).sum(axis=0) / (dt * dt).sum(axis=0)
+        decay = np.where((count >= 2) & (slope < 0), -60 / slope, np.nan)
+    return float(decay) if decay.ndim == 0 else decay
+
+
+def edt(times, energy):
+    """
+    Early decay time, from the first 10dB of the Schroeder decay curve
+    """
+    return decay_time(times, schroeder(energy), 0, -10)
+
+
+def t20(times, energy):
+    """
+    Reverberation time from the Schroeder decay curve between -5dB and -25dB
+    """
+    return decay_time(times, schroeder(energy), -5, -25)
+
+
+def t30(times, energy):
+    """
+    Reverberation time from the Schroeder decay curve between -5dB and -35dB
+    """
+    return decay_time(times, schroeder(energy), -5, -35)
+
+
+def clarity(times, energy, limit=0.08):
+    """
+    Ratio in dB of the energy arriving within `limit` seconds of the first
+    arrival to the energy arriving after it
+    - C80 ( limit = 0.08 ) for music
+    - C50 ( limit = 0.05 ) for speech
+    """
+    energy = np.asarray(energy, dtype=float)
+    times = np.asarray(times, dtype=float)
+    arrived = np.flatnonzero((energy > 0).reshape(len(energy), -1).any(axis=1))
+    if len(arrived) == 0:
+        return np.nan if energy.ndim == 1 else np.full(energy.shape[1:], np.nan)
+
+    early = times < times[arrived[0]] + limit
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = 10 * np.log10(energy[early].sum(axis=0) / energy[~early].sum(axis=0))
+    return float(ratio) if ratio.ndim == 0 else ratio
+
+
 def db_to_color(level):
     """
     Converts given dB level (0-120) to RGB using HSV values
     - Range from Red to Cyan 
     - Red  ( >= 120dB ) = (0, 1, 1) HSV
-    - Cyan ( <=   0dB ) = (180, 1, 1)  HSV
+    - Cyan ( <=   0dB ) = (180, 1, 1)  HSV\n
+    Arrays of levels give an array with the RGB color of each level in its last
+    axis.
     """
 
     # Ensure level is in proper bounds
-    level = 0 if level < 0 else level
-    level = 120 if level > 120 else level
-
-    hue = (level - 120) * -1.5  # HSV Hue
-    return hsv_to_rgb(hue / 360, 1, 1)
+    level = np.clip(np.asarray(level, dtype=float), 0, 120)
+
+    hue = (120 - level) * 1.5  # HSV Hue
+
+    # With full saturation and value the hue only ramps up or down one channel
+    # per sixth of the color wheel
+    sector = hue / 60
+    rgb = np.stack(
+        [
+            np.clip(2 - sector, 0, 1),
+            np.clip(sector, 0, 1),
+            np.clip(sector - 2, 0, 1),
+        ],
+        axis=-1,
+    )
+    return tuple(rgb.tolist()) if rgb.ndim == 1 else rgb
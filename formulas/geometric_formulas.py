@@ -7,14 +7,7 @@ def volume(vertices, faces):
     Calculates volume of the object denoted by the given vertices
     and faces using triangulation
     """
-    vols = []
-    for face in faces:
-        vols = np.append(
-            vols,
-            signed_volume_triangle(
-                face.vertices[0], face.vertices[1], face.vertices[2]
-            ),
-        )
+    vols = (faces.v0 * np.cross(faces.v1, faces.v2)).sum(axis=1) / 6.0
     return np.abs(np.sum(vols))
 
 
@@ -31,10 +24,7 @@ def surface_area(faces):
     Calculates surface area of the object denoted by the given vertices
     and faces using triangulation
     """
-    area = []
-    for face in faces:
-        area.append(triangle_area(face.vertices[0], face.vertices[1], face.vertices[2]))
-    return np.sum(area)
+    return np.sum(faces.areas)
 
 
 def triangle_area(v1, v2, v3):
@@ -49,11 +39,7 @@ def calc_center(vertices, faces):
     Calculates center of the object denoted by the given vertices
     and faces using triangulation
     """
-    centers = []
-    for face in faces:
-        centers.append(
-            triangle_center(face.vertices[0], face.vertices[1], face.vertices[2])
-        )
+    centers = np.mean(faces.corners(), axis=1)
     return Vec3(*np.mean(centers, axis=0))
 
 
@@ -62,3 +48,14 @@ def triangle_center(v1, v2, v3):
     Calculates the center of a triangle
     """
     return np.mean([v1.vec, v2.vec, v3.vec], axis=0)
+
+
+def calc_bounds(faces):
+    """
+    Calculates the axis aligned bounding box of the object denoted by the
+    given faces. Returns the minimum and maximum corners.
+    """
+    if len(faces) == 0:
+        return Vec3(0, 0, 0), Vec3(0, 0, 0)
+    corners = faces.corners().reshape(-1, 3)
+    return Vec3(*np.min(corners, axis=0)), Vec3(*np.max(corners, axis=0))
@@ -1,38 +1,23 @@
-import numpy as np
-
 from geometry.vec3 import Vec3
-from formulas.geometric_formulas import triangle_area
 from geometry.materials import Materials as mtl
 
 
 class Face:
     """
-    Represents the triangular face of a 3D object
+    Represents the triangular face of a 3D object\n
+    A view of one row of a `FaceTable`, its properties are read from and
+    written to the arrays of the table.
     """
 
-    def __init__(
-        self,
-        vertices: np.ndarray,
-        normal: Vec3 = None,
-        kd: float = 0.1,
-        ks: float = 0.9,
-        material: int = mtl.HARDWOOD,
-    ):
-        self.vertices = vertices
-        if normal is not None:
-            self.normal = normal
-        elif len(vertices) >= 3:
-            self.normal = self.calc_normal()
-        self.edge1 = self.vertices[1].sub(self.vertices[0])
-        self.edge2 = self.vertices[2].sub(self.vertices[0])
-        self.kd = kd
-        self.ks = ks
-        self.surface_area = triangle_area(*self.vertices)
-        self.material = material
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index: int):
+        self.table = table
+        self.index = index
 
     def __str__(self):
         """
-        Provides a useful string representation of a Face object. 
+        Provides a useful string representation of a Face object.
         """
         string = "Vertices: ["
         for v in self.vertices:
@@ -41,12 +26,46 @@ class Face:
         string += " Material: " + mtl.name(self.material)
         return string
 
-    def calc_normal(self):
-        """
-        Calculate the face normal using the vertices
-        """
-        normal = np.cross(
-            self.vertices[1].vec - self.vertices[0].vec,
-            self.vertices[2].vec - self.vertices[0].vec,
-        )
-        return Vec3(*normal).normalize()
+    @property
+    def vertices(self) -> [Vec3]:
+        return [Vec3(*self.table.vertices[i]) for i in self.table.indices[self.index]]
+
+    @property
+    def normal(self) -> Vec3:
+        return Vec3(*self.table.normals[self.index])
+
+    @property
+    def edge1(self) -> Vec3:
+        return Vec3(*self.table.edge1[self.index])
+
+    @property
+    def edge2(self) -> Vec3:
+        return Vec3(*self.table.edge2[self.index])
+
+    @property
+    def surface_area(self) -> float:
+        return float(self.table.areas[self.index])
+
+    @property
+    def kd(self) -> float:
+        return float(self.table.kd[self.index])
+
+    @kd.setter
+    def kd(self, kd: float):
+        self.table.kd[self.index] = kd
+
+    @property
+    def ks(self) -> float:
+        return float(self.table.ks[self.index])
+
+    @ks.setter
+    def ks(self, ks: float):
+        self.table.ks[self.index] = ks
+
+    @property
+    def material(self) -> int:
+        return int(self.table.materials[self.index])
+
+    @material.setter
+    def material(self, material: int):
+        self.table.materials[self.index] = material
@@ -0,0 +1,139 @@
+import os
+import numpy as np
+
+from geometry.face import Face
+from geometry.materials import Materials as mtl
+
+# Arrays of a face table written by `save`, one .npy file each
+ARRAYS = (
+    "vertices",
+    "indices",
+    "edge1",
+    "edge2",
+    "normals",
+    "areas",
+    "kd",
+    "ks",
+    "materials",
+)
+# Arrays that are edited after loading, so they are read into memory
+EDITABLE = ("kd", "ks", "materials")
+
+
+def save_array(path, array: np.ndarray):
+    """
+    Writes an array to a .npy file through a temporary file that replaces it
+    once complete, so an interrupted or concurrent write never leaves a partly
+    written array to be memory-mapped
+    """
+    temp = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp, "wb") as file:
+        np.save(file, array)
+    os.replace(temp, path)
+
+
+class FaceTable:
+    """
+    Indexed triangle mesh holding the faces of a 3D object as arrays\n
+    The corners of face `i` are the rows `indices[i]` of the shared `vertices`
+    array. Everything the raytracer and the formulas need per face is kept in
+    contiguous (F, 3) or (F,) arrays: the edges from the first corner, the unit
+    normals, the areas, the diffusion and specular coefficients and the
+    material ids.
+    Indexing the table gives a `Face` view of one row.
+    """
+
+    def __init__(
+        self,
+        vertices: np.ndarray,
+        indices: np.ndarray,
+        normals: np.ndarray = None,
+        kd: float = 0.1,
+        ks: float = 0.9,
+        material: int = mtl.HARDWOOD,
+    ):
+        self.vertices = np.ascontiguousarray(vertices, dtype=float).reshape(-1, 3)
+        self.indices = np.ascontiguousarray(indices, dtype=np.int64).reshape(-1, 3)
+
+        v0, v1, v2 = self.v0, self.v1, self.v2
+        self.edge1 = v1 - v0
+        self.edge2 = v2 - v0
+
+        # Given normals may be averages of vertex normals, so they are scaled to
+        # unit length. Faces without a usable normal get the normal of their winding
+        self.normals = np.full((len(self.indices), 3), np.nan)
+        if normals is not None:
+            self.normals[:] = normals
+        lengths = np.linalg.norm(self.normals, axis=1)
+        missing = ~(lengths > 0)
+        self.normals[~missing] /= lengths[~missing, None]
+        winding = np.cross(self.edge1[missing], self.edge2[missing])
+        self.normals[missing] = winding / np.linalg.norm(winding, axis=1)[:, None]
+
+        self.areas = 0.5 * np.linalg.norm(np.cross(v1 - v0, v2 - v0), axis=1)
+        self.kd = np.full(len(self.indices), kd, dtype=float)
+        self.ks = np.full(len(self.indices), ks, dtype=float)
+        self.materials = np.full(len(self.indices), material, dtype=np.int64)
+
+    @property
+    def v0(self) -> np.ndarray:
+        """
+        First corner of every face
+        """
+        return self.vertices[self.indices[:, 0]]
+
+    @property
+    def v1(self) -> np.ndarray:
+        """
+        Second corner of every face
+        """
+        return self.vertices[self.indices[:, 1]]
+
+    @property
+    def v2(self) -> np.ndarray:
+        """
+        Third corner of every face
+        """
+        return self.vertices[self.indices[:, 2]]
+
+    def corners(self) -> np.ndarray:
+        """
+        Returns the (F, 3, 3) corners of every face
+        """
+        return self.vertices[self.indices]
+
+    def save(self, directory):
+        """
+        Writes the arrays of the table into a directory of .npy files, each one
+        replaced whole
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            save_array(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r") -> "FaceTable":
+        """
+        Loads a table written by `save`\n
+        The geometry is memory-mapped, so it is only read from disk as it is
+        used and models larger than memory can be paged in by the OS.
+        """
+        table = cls.__new__(cls)
+        for name in ARRAYS:
+            mode = None if name in EDITABLE else mmap_mode
+            array = np.load(os.path.join(directory, name + ".npy"), mmap_mode=mode)
+            setattr(table, name, array)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Face(self, i) for i in range(len(self))[index]]
+        if not -len(self) <= index < len(self):
+            raise IndexError("Face index out of range")
+        return Face(self, index % len(self))
+
+    def __iter__(self):
+        return (Face(self, index) for index in range(len(self)))
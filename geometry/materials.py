@@ -1,3 +1,7 @@
+import csv
+import numpy as np
+
+
 class Materials:
     HARDWOOD = 0
     CARPET = 1
@@ -6,92 +10,161 @@ class Materials:
     CONCRETE = 4
     FOAM = 5
 
+    # Octave bands the absorption coefficients are known for
+    BANDS = [125, 250, 500, 1000, 2000, 4000]
+
+    # Name, color and absorption coefficient per band of every material, indexed
+    # by material id. Materials loaded from a file are appended.
+    NAMES = ["Hardwood", "Carpet", "Drywall", "Brick", "Concrete", "Foam"]
+    COLORS = np.array(
+        [
+            [0.34, 0.26, 0.01, 0.5],
+            [0.23, 0.40, 0.72, 0.5],
+            [0.92, 0.89, 0.78, 0.5],
+            [0.63, 0.09, 0, 0.5],
+            [0.45, 0.45, 0.45, 0.5],
+            [0.81, 0.77, 0.10, 0.5],
+        ]
+    )
+    COEFFICIENTS = np.array(
+        [
+            [0.19, 0.23, 0.25, 0.30, 0.37, 0.42],
+            [0.03, 0.09, 0.20, 0.54, 0.70, 0.72],
+            [0.29, 0.10, 0.05, 0.04, 0.07, 0.09],
+            [0.05, 0.04, 0.02, 0.04, 0.05, 0.05],
+            [0.01, 0.01, 0.01, 0.02, 0.02, 0.02],
+            [0.25, 0.50, 0.85, 0.95, 0.90, 0.90],
+        ]
+    )
+
+    # Color of loaded materials that do not specify one
+    DEFAULT_COLOR = [0.5, 0.5, 0.5, 0.5]
+
+    @staticmethod
+    def count() -> int:
+        """
+        Number of known materials, their ids run from 0 up to the count.
+        """
+        return len(Materials.NAMES)
+
     @staticmethod
     def name(material: int):
         """
         Returns the string name of each material.
         """
-        return {
-            Materials.HARDWOOD: "Hardwood",
-            Materials.CARPET: "Carpet",
-            Materials.DRYWALL: "Drywall",
-            Materials.BRICK: "Brick",
-            Materials.CONCRETE: "Concrete",
-            Materials.FOAM: "Foam",
-        }.get(material, "")
+        if 0 <= material < Materials.count():
+            return Materials.NAMES[material]
+        return ""
 
     @staticmethod
-    def absorption(material: int, freq: int) -> float:
+    def interpolate(coefficients: np.ndarray, bands, freq) -> np.ndarray:
         """
-        Absorption coefficient at the given frequency
+        Interpolates (materials, bands) coefficients to the given frequencies over
+        log frequency\n
+        Frequencies outside of the bands get the coefficient of the nearest band.
+        Returns (materials, frequencies) coefficients.
         """
-        if material == Materials.HARDWOOD:
-            return {
-                125: 0.19,
-                250: 0.23,
-                500: 0.25,
-                1000: 0.30,
-                2000: 0.37,
-                4000: 0.42,
-            }.get(freq, 0)
-        elif material == Materials.CARPET:
-            return {
-                125: 0.03,
-                250: 0.09,
-                500: 0.20,
-                1000: 0.54,
-                2000: 0.70,
-                4000: 0.72,
-            }.get(freq, 0)
-        elif material == Materials.DRYWALL:
-            return {
-                125: 0.29,
-                250: 0.10,
-                500: 0.05,
-                1000: 0.04,
-                2000: 0.07,
-                4000: 0.09,
-            }.get(freq, 0)
-        elif material == Materials.BRICK:
-            return {
-                125: 0.05,
-                250: 0.04,
-                500: 0.02,
-                1000: 0.04,
-                2000: 0.05,
-                4000: 0.05,
-            }.get(freq, 0)
-        elif material == Materials.CONCRETE:
-            return {
-                125: 0.01,
-                250: 0.01,
-                500: 0.01,
-                1000: 0.02,
-                2000: 0.02,
-                4000: 0.02,
-            }.get(freq, 0)
-        elif material == Materials.FOAM:
-            return {
-                125: 0.25,
-                250: 0.50,
-                500: 0.85,
-                1000: 0.95,
-                2000: 0.90,
-                4000: 0.90,
-            }.get(freq, 0)
-        else:
-            return 0
+        log_bands = np.log(np.asarray(bands, dtype=float))
+        log_freq = np.log(np.clip(np.atleast_1d(freq), bands[0], bands[-1]))
+        i = np.clip(np.searchsorted(log_bands, log_freq, side="right") - 1, 0, None)
+        i = np.minimum(i, len(bands) - 2)
+        t = (log_freq - log_bands[i]) / (log_bands[i + 1] - log_bands[i])
+        return coefficients[:, i] * (1 - t) + coefficients[:, i + 1] * t
+
+    @staticmethod
+    def absorption_table(freq) -> np.ndarray:
+        """
+        Returns the (materials, frequencies) absorption coefficients of every
+        material at the given frequencies
+        """
+        return Materials.interpolate(Materials.COEFFICIENTS, Materials.BANDS, freq)
+
+    @staticmethod
+    def absorption(material, freq):
+        """
+        Absorption coefficient at the given frequency\n
+        Takes a material id or an array of them and a frequency or a list of them,
+        giving an array of `material.shape + freq.shape` coefficients. Frequencies
+        between the bands are interpolated, unknown materials absorb nothing.
+        """
+        ids = np.asarray(material, dtype=np.int64)
+        table = Materials.absorption_table(freq)
+        known = (ids >= 0) & (ids < len(table))
+        coefficients = np.where(known[..., None], table[np.where(known, ids, 0)], 0.0)
+        if np.ndim(freq) == 0:
+            coefficients = coefficients[..., 0]
+        return float(coefficients) if coefficients.ndim == 0 else coefficients
 
     @staticmethod
     def color(material: int):
         """
         Returns the color value of each material.
         """
-        return {
-            Materials.HARDWOOD: [0.34, 0.26, 0.01, 0.5],
-            Materials.CARPET: [0.23, 0.40, 0.72, 0.5],
-            Materials.DRYWALL: [0.92, 0.89, 0.78, 0.5],
-            Materials.BRICK: [0.63, 0.09, 0, 0.5],
-            Materials.CONCRETE: [0.45, 0.45, 0.45, 0.5],
-            Materials.FOAM: [0.81, 0.77, 0.10, 0.5],
-        }.get(material, [0, 0, 0, 0])
+        if 0 <= material < Materials.count():
+            return Materials.COLORS[material].tolist()
+        return [0, 0, 0, 0]
+
+    @staticmethod
+    def load(filename) -> list:
+        """
+        Adds the materials of a CSV file and returns their ids\n
+        The header names the columns: `name`, optionally `red`, `green`, `blue`
+        and `alpha`, and one column per frequency holding the absorption
+        coefficients at that frequency. Coefficients are interpolated onto the
+        octave bands. Materials with the name of a known material replace it.
+        Raises ValueError for a malformed file, leaving the known materials as
+        they are.
+        """
+        with open(filename, newline="") as file:
+            rows = list(csv.DictReader(file))
+        if not rows:
+            return []
+        if "name" not in rows[0]:
+            raise ValueError("No name column in {}".format(filename))
+
+        freqs = []
+        for key in rows[0]:
+            try:
+                freqs.append((float(key), key))
+            except (TypeError, ValueError):
+                continue
+        freqs.sort()
+        if not freqs:
+            raise ValueError("No frequency columns in {}".format(filename))
+        try:
+            coefficients = np.array(
+                [[float(row[key]) for _, key in freqs] for row in rows], dtype=float
+            )
+            colors = [
+                [
+                    float(row[key]) if row.get(key) else default
+                    for key, default in zip(
+                        ("red", "green", "blue", "alpha"), Materials.DEFAULT_COLOR
+                    )
+                ]
+                for row in rows
+            ]
+        except (TypeError, ValueError):
+            raise ValueError("Invalid number in {}".format(filename))
+        bands = [freq for freq, _ in freqs]
+        if len(bands) > 1:
+            coefficients = Materials.interpolate(coefficients, bands, Materials.BANDS)
+        else:
+            coefficients = np.repeat(coefficients, len(Materials.BANDS), axis=1)
+
+        ids = []
+        for row, color, coefficient in zip(rows, colors, coefficients):
+            name = (row["name"] or "").strip()
+            if name in Materials.NAMES:
+                material = Materials.NAMES.index(name)
+                Materials.COLORS[material] = color
+                Materials.COEFFICIENTS[material] = coefficient
+            else:
+                material = Materials.count()
+                Materials.NAMES.append(name)
+                Materials.COLORS = np.vstack([Materials.COLORS, color])
+                Materials.COEFFICIENTS = np.vstack(
+                    [Materials.COEFFICIENTS, coefficient]
+                )
+            ids.append(material)
+        return ids
@@ -1,8 +1,12 @@
+import numpy as np
+
 from geometry.vec3 import Vec3
 from geometry.materials import Materials as mtl
 
 
 class Ray:
+    __slots__ = ("origin", "direction", "dist_from_origin", "start_db")
+
     def __init__(
         self,
         origin: Vec3,
@@ -32,3 +36,61 @@ class Ray:
         """
         ray = Vec3(*(-(normal * (self.direction.dot(normal) * 2)).sub(self.direction)))
         return Ray(phit, ray, dist_from_origin, db)
+
+
+class RayBatch:
+    """
+    Structure of arrays holding a batch of rays\n
+    The origins and directions are contiguous (N, 3) arrays, the distances
+    travelled from the sound source an (N,) array and the dB levels an (N,) or
+    (N, bands) array. `scales` holds the linear factor the intensity of each level
+    is multiplied by when it is summed into the map, the weight of rays standing
+    in for others during russian roulette. Indexing a batch with a slice, mask or
+    index array returns the batch of the selected rays.
+    """
+
+    __slots__ = ("origins", "directions", "dist_from_origin", "levels", "scales")
+
+    def __init__(self, origins, directions, dist_from_origin, levels, scales=None):
+        self.origins = np.ascontiguousarray(origins, dtype=float).reshape(-1, 3)
+        self.directions = np.ascontiguousarray(directions, dtype=float).reshape(-1, 3)
+        self.dist_from_origin = np.ascontiguousarray(dist_from_origin, dtype=float)
+        self.levels = np.ascontiguousarray(levels, dtype=float)
+        if scales is None:
+            scales = np.ones(self.levels.shape)
+        self.scales = np.ascontiguousarray(scales, dtype=float)
+
+    @classmethod
+    def from_rays(cls, rays: [Ray]) -> "RayBatch":
+        """
+        Gathers a list of rays into a batch
+        """
+        return cls(
+            np.array([ray.origin.vec for ray in rays]),
+            np.array([ray.direction.vec for ray in rays]),
+            np.array([ray.dist_from_origin for ray in rays]),
+            np.array([ray.start_db for ray in rays]),
+        )
+
+    def to_rays(self) -> [Ray]:
+        """
+        Splits the batch into a list of rays
+        """
+        return [
+            Ray(Vec3(*origin), Vec3(*direction), dist, db)
+            for origin, direction, dist, db in zip(
+                self.origins, self.directions, self.dist_from_origin, self.levels
+            )
+        ]
+
+    def __len__(self) -> int:
+        return len(self.origins)
+
+    def __getitem__(self, index) -> "RayBatch":
+        return RayBatch(
+            self.origins[index],
+            self.directions[index],
+            self.dist_from_origin[index],
+            self.levels[index],
+            self.scales[index],
+        )
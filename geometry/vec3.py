@@ -7,12 +7,20 @@ class Vec3:
     An enhanced tuple containing 3 points
     """
 
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x: float, y: float, z: float):
-        self.vec = np.array([x, y, z], dtype=float)
         self.x = float(x)
         self.y = float(y)
         self.z = float(z)
 
+    @property
+    def vec(self) -> np.ndarray:
+        """
+        The components as a NumPy array, built when asked for
+        """
+        return np.array([self.x, self.y, self.z])
+
     def __str__(self):
         """
         Provides a useful string representation of a Vec3 object.
@@ -23,23 +31,7 @@ class Vec3:
         """
         Vec3 iterator.
         """
-        self.num = 0
-        return self
-
-    def __next__(self):
-        """
-        Vec3 next function for iteration.
-        """
-        if self.num >= 3:
-            raise StopIteration
-
-        self.num += 1
-        if self.num == 1:
-            return self.x
-        elif self.num == 2:
-            return self.y
-        else:
-            return self.z
+        return iter((self.x, self.y, self.z))
 
     def __neg__(self):
         """
@@ -10,10 +10,21 @@ import OpenGL.GLUT as glut
 import numpy as np
 
 from fileloader import *
-from raytracing.raytracer import RayTracer
+from UI.trace_thread import TraceThread, UpdateThread
+from raytracing.raytracer import MIN_DECAY_REFLECTIONS
 from formulas.geometric_formulas import volume, surface_area, calc_center
 from geometry.vec3 import Vec3
 
+# Most rays traced for every decibel map
+RAY_NUM = 20000
+# Number of rays, reflections included, traced between refreshes of the decibel
+# map, so a refresh takes about as long for any number of reflections
+REFRESH_RAYS = 100000
+# Error in dB at which the decibel map is considered done
+TARGET_DB = 1.0
+# Seconds the decibel map is traced for at most
+TIME_BUDGET = 30.0
+
 
 class GLWidget(QOpenGLWidget):
     x_rotation_changed = pyqtSignal(int)
@@ -22,6 +33,8 @@ class GLWidget(QOpenGLWidget):
     x_position_changed = pyqtSignal(int)
     y_position_changed = pyqtSignal(int)
     zoom_degree_changed = pyqtSignal(int)
+    trace_progress = pyqtSignal(int, int, float, float)
+    trace_finished = pyqtSignal(bool, bool, float)
 
     def __init__(self, parent=None, filename=""):
         super().__init__(parent)
@@ -32,6 +45,9 @@ class GLWidget(QOpenGLWidget):
         self.object_surface_area = 0
         self.object_center = Vec3(0, 0, 0)
         self.raytracer = 0
+        self.trace_thread = None
+        self.update_thread = None
+        self.pending_update = None
         self.rays = None
         self.x_rot = 0
         self.y_rot = 0
@@ -116,9 +132,21 @@ class GLWidget(QOpenGLWidget):
     def load_model(self, filename):
         """
         Loads the specified file and generates the corresponding model.
-        """
+        Raises OSError or ValueError when the file cannot be loaded, keeping the
+        current model.
+        """
+        obj_file = load_mesh(filename)
+        if self.trace_thread is not None:
+            self.cancel_raytracer()
+            self.trace_thread = None
+            self.trace_finished.emit(True, False, math.nan)
+        self.raytracer = 0
+        self.update_thread = None
+        self.pending_update = None
+        self.rays = None
+
         self.filename = filename
-        self.obj_file = ObjLoader(filename)
+        self.obj_file = obj_file
         self.object_vertices = self.obj_file.vertices
         self.object_faces = self.obj_file.faces
 
@@ -207,11 +235,118 @@ class GLWidget(QOpenGLWidget):
     def run_raytracer(self, start_db=120, freq=1000, reflections=0):
         """
         Runs the raytracing algorithm to generate the decibel map of the model.
+        The rays are traced in the background and the map is refreshed as they come in.
+        Arrival times are only recorded when enough reflections are traced for the
+        decay to give the reverberation time.
+        """
+        self.cancel_raytracer()
+        self.update_thread = None
+        self.pending_update = None
+        self.trace_thread = TraceThread(
+            REFRESH_RAYS,
+            self.sound_source,
+            RAY_NUM,
+            self.obj_file.faces,
+            start_db,
+            freq,
+            reflections,
+            parent=self,
+            record_paths=True,
+            hit_map="lightmap",
+            record_echogram=reflections >= MIN_DECAY_REFLECTIONS,
+            target_db=TARGET_DB,
+            time_budget=TIME_BUDGET,
+        )
+        self.trace_thread.partial.connect(self.show_rays)
+        self.trace_thread.progress.connect(self.trace_progress)
+        self.trace_thread.finished.connect(self.raytracer_finished)
+        self.trace_thread.start()
+
+    def cancel_raytracer(self):
         """
-        self.raytracer = RayTracer(
-            self.sound_source, 1000, self.obj_file.faces, start_db, freq, reflections
+        Stops the raytracing algorithm if it is running, keeping the rays traced so far.
+        The thread winds down in the background and `raytracer_finished` picks up
+        its rays, unless another trace has been started in the meantime.
+        """
+        if self.trace_thread is not None:
+            self.trace_thread.requestInterruption()
+
+    def raytracer_finished(self):
+        """
+        Signaled when the raytracing algorithm is done or has been cancelled.
+        """
+        thread = self.sender()
+        thread.deleteLater()
+        if thread is not self.trace_thread:
+            return
+        self.raytracer = thread.raytracer
+        self.trace_thread = None
+        error = math.nan if self.raytracer.error is None else self.raytracer.error
+        self.trace_finished.emit(
+            thread.isInterruptionRequested(), self.raytracer.converged, error
         )
+
+    def update_raytracer(self, start_db=None, freq=None):
+        """
+        Recalculates the finished decibel map for the current materials and the
+        given start level and frequency from its recorded paths, without tracing.
+        The map is recalculated in the background and shown once it is done,
+        changes made in the meantime are applied after it.
+        """
+        if not self.raytracer or self.trace_thread is not None:
+            return
+        if self.update_thread is not None:
+            pending = self.pending_update or {}
+            if start_db is not None:
+                pending["start_db"] = start_db
+            if freq is not None:
+                pending["freq"] = freq
+            self.pending_update = pending
+            return
+        self.update_thread = UpdateThread(self.raytracer, start_db, freq, parent=self)
+        self.update_thread.finished.connect(self.raytracer_updated)
+        self.update_thread.start()
+
+    def raytracer_updated(self):
+        """
+        Signaled when the decibel map has been recalculated, shows it and applies
+        the changes made while it was recalculated.
+        """
+        thread = self.sender()
+        thread.deleteLater()
+        if thread is not self.update_thread:
+            return
+        self.update_thread = None
+        if thread.raytracer is not self.raytracer:
+            return
+        self.makeCurrent()
+        if self.rays is not None:
+            gl.glDeleteLists(self.rays, 1)
         self.rays = self.raytracer.render()
+        self.doneCurrent()
+        self.update()
+
+        if self.pending_update is not None:
+            pending, self.pending_update = self.pending_update, None
+            self.update_raytracer(**pending)
+
+    def updating(self) -> bool:
+        """
+        Whether the decibel map is being recalculated in the background
+        """
+        return self.update_thread is not None
+
+    def show_rays(self, points):
+        """
+        Replaces the rendered decibel map with the given points.
+        """
+        if self.sender() is not self.trace_thread:
+            return
+        self.makeCurrent()
+        if self.rays is not None:
+            gl.glDeleteLists(self.rays, 1)
+        self.rays = self.trace_thread.raytracer.render(points)
+        self.doneCurrent()
         self.update()
 
     def mousePressEvent(self, event):
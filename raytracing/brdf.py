@@ -1,16 +1,26 @@
-import random
-import math
 import numpy as np
-from geometry.vec3 import Vec3
-from geometry.face import Face
-from geometry.ray import Ray
+
+from raytracing import kernels
+from raytracing.intersection import dot
+from raytracing.sampler import hemisphere_directions
+
+# Number of hemisphere rays every hit emits besides its specular ray
+HEMISPHERE_RAYS = 100
 
 
 def generate_brdf(
-    sm: Ray, phit: Vec3, start_db: float, dist_from_origin: float, face: Face
-):
+    directions: np.ndarray,
+    phit: np.ndarray,
+    normals: np.ndarray,
+    start_db: np.ndarray,
+    dist_from_origin: np.ndarray,
+    kd: np.ndarray,
+    ks: np.ndarray,
+    ray_num=HEMISPHERE_RAYS,
+) -> tuple:
     """
-    Generates an array of rays whose starting dB levels are calculated using the Phong BRDF model
+    Generates the rays reflected at each hit whose starting dB levels are calculated
+    using the Phong BRDF model
     ## D( kd( Sm.dot(normal) ) + ks( V.dot(Rm) ) )
     - D  - the percentage of acoustic energy in each ray\n
     - kd - diffusion coefficient\n
@@ -18,55 +28,138 @@ def generate_brdf(
     - Sm - incident ray\n
     - n  - surface normal\n
     - V  - reflected ray\n
-    - Rm - rays of hemisphere from surface
+    - Rm - rays of hemisphere from surface\n
+    Every hit emits its specular ray followed by `ray_num` hemisphere rays. The
+    hits carry a dB level per frequency band in the columns of `start_db`.
+    Returns the origins, directions, distances, dB levels, BRDF weights and
+    intensity scales of all rays.
     """
-    rm = sm.calc_reflection(phit, face.normal, dist_from_origin, start_db)
-    v = generate_v(
-        phit,
-        face.normal,
-        face.normal.dot(rm.direction),
-        start_db,
-        dist_from_origin,
-        100,
-    )
-    diffuse = face.kd * sm.direction.dot(face.normal)
-    for ray in v:
-        specular = face.ks * rm.direction.dot(ray.direction)
-        ray.start_db = start_db * (diffuse + specular)
-
-    v = [rm] + v
-    return v
-
-
-def generate_v(
-    origin: Vec3,
-    normal: Vec3,
-    valid_side: float,
-    start_db: float,
-    dist_from_origin: float,
-    ray_num,
-) -> list:
+    rm = reflect(directions, normals)
+    v = generate_v(normals, dot(normals, rm), ray_num)
+    weights = phong_weights(directions, normals, rm, v, kd, ks)
+    v_db = start_db[:, None] * weights[..., None]
+    scales = np.ones(weights.shape)
+    return pack_rays(phit, rm, v, dist_from_origin, start_db, v_db, weights, scales)
+
+
+def sample_brdf(
+    directions: np.ndarray,
+    phit: np.ndarray,
+    normals: np.ndarray,
+    start_db: np.ndarray,
+    dist_from_origin: np.ndarray,
+    kd: np.ndarray,
+    ks: np.ndarray,
+    samples=1,
+    ray_num=HEMISPHERE_RAYS,
+) -> tuple:
+    """
+    Importance sampled version of `generate_brdf`\n
+    Out of the `ray_num` hemisphere rays only `samples` are kept per hit, picked
+    with a probability proportional to their sound intensity in the loudest band.
+    A picked ray keeps the dB level it has in `generate_brdf`, and its intensity
+    scale is one over the probability of picking it times `samples`. The scale is
+    only applied when hits are summed into the map, so the expected intensity
+    everything after the hit adds to the map matches that of `generate_brdf`.\n
+    Every hit emits its specular ray followed by `samples` sampled rays.
+    Returns the origins, directions, distances, dB levels, Phong weights and
+    intensity scales of all rays.
+    """
+    rm = reflect(directions, normals)
+    v = generate_v(normals, dot(normals, rm), ray_num)
+    weights = phong_weights(directions, normals, rm, v, kd, ks)
+    levels = np.nanmax(start_db, axis=1)[:, None] * weights
+
+    # Intensities relative to the loudest ray of each hit, rays without a
+    # positive level are never traced and so are never picked
+    peak = levels.max(axis=1)
+    intensity = np.where(levels > 0, 10 ** ((levels - peak[:, None]) / 10), 0.0)
+
+    # Pick hemisphere rays by inverting the cumulative intensity of each hit
+    cdf = np.cumsum(intensity, axis=1)
+    total = cdf[:, -1]
+    u = np.random.random((len(v), samples)) * total[:, None]
+    picked = np.minimum((cdf[:, None] <= u[..., None]).sum(axis=-1), ray_num - 1)
+
+    rows = np.arange(len(v))[:, None]
+    v = v[rows, picked]
+    weights = weights[rows, picked]
+    band_db = start_db[:, None] * weights[..., None]
+    v_db = np.where(band_db > 0, band_db, np.nan)
+    picked_intensity = intensity[rows, picked]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scales = np.where(
+            picked_intensity > 0, total[:, None] / (samples * picked_intensity), 0.0
+        )
+    return pack_rays(phit, rm, v, dist_from_origin, start_db, v_db, weights, scales)
+
+
+def phong_weights(directions, normals, rm, v, kd, ks) -> np.ndarray:
     """
-    Generates rays in a hemisphere to represent reflected rays 
+    Percentage of acoustic energy carried by each of the hemisphere rays `v`
     """
-    rnd = random.random() * ray_num
+    if kernels.enabled():
+        arrays = (directions, normals, rm, v, kd, ks)
+        weights = np.empty(v.shape[:2])
+        kernels.phong(*(np.ascontiguousarray(a, dtype=float) for a in arrays), weights)
+        return weights
+    diffuse = kd * dot(directions, normals)
+    specular = ks[:, None] * dot(rm[:, None], v)
+    return diffuse[:, None] + specular
 
-    points = []
-    offset = 2.0 / ray_num
-    increment = math.pi * (3.0 - math.sqrt(5.0))
 
-    for i in range(ray_num):
-        y = ((i * offset) - 1) + (offset / 2)
-        r = math.sqrt(1 - pow(y, 2))
+def pack_rays(
+    phit, rm, v, dist_from_origin, start_db, v_db, weights, scales
+) -> tuple:
+    """
+    Flattens the specular and hemisphere rays of each hit into arrays of rays,
+    the specular ray keeps the full level of the hit and an intensity scale of 1
+    """
+    per_hit = v.shape[1] + 1
+    bands = start_db.shape[1]
+    return (
+        np.repeat(phit, per_hit, axis=0),
+        np.concatenate([rm[:, None], v], axis=1).reshape(-1, 3),
+        np.repeat(dist_from_origin, per_hit),
+        np.concatenate([start_db[:, None], v_db], axis=1).reshape(-1, bands),
+        np.concatenate([np.ones((len(v), 1)), weights], axis=1).reshape(-1),
+        np.concatenate([np.ones((len(v), 1)), scales], axis=1).reshape(-1),
+    )
+
+
+def reflect(directions: np.ndarray, normals: np.ndarray) -> np.ndarray:
+    """
+    Calculates the reflected directions based on incidence and normal
+    """
+    return directions - normals * (2 * dot(directions, normals))[:, None]
+
 
-        phi = ((i + rnd) % ray_num) * increment
+def generate_v(normals: np.ndarray, valid_side: np.ndarray, ray_num) -> np.ndarray:
+    """
+    Generates directions in a hemisphere to represent reflected rays\n
+    Returns an array of shape (hits, ray_num, 3).
+    """
+    return hemisphere_directions(normals, valid_side, ray_num)
 
-        x = math.cos(phi) * r
-        z = math.sin(phi) * r
 
-        vec = Vec3(x, y, z).normalize()
-        if np.sign(normal.dot(vec)) != np.sign(valid_side):
-            # Ensure that the rays are inside the object
-            vec = -vec
-        points.append(Ray(origin, vec, dist_from_origin, start_db))
-    return points
+def terminate(levels: np.ndarray, cutoff=0.0, roulette=None) -> tuple:
+    """
+    Decides which of the reflected rays are traced further\n
+    Every band of a ray is terminated on its own. Bands at or below the `cutoff`
+    level are dropped. Bands below the `roulette` level survive with probability
+    `p`, their intensity over that of the `roulette` level. Survivors keep their
+    level but their intensity is scaled by `1 / p`, so the expected intensity
+    everything after them adds to the map is unchanged. Dropped bands are set to
+    not a number.\n
+    Returns which of the rays still carry a band, their levels and the linear
+    factors their intensity is scaled by.
+    """
+    keep = levels > cutoff
+    scales = np.ones(levels.shape)
+    if roulette is not None:
+        weak = keep & (levels < roulette)
+        with np.errstate(invalid="ignore"):
+            p = np.where(weak, 10 ** ((levels - roulette) / 10), 1.0)
+        keep &= ~weak | (np.random.random(levels.shape) < p)
+        scales = np.where(weak, 1 / p, 1.0)
+    return keep.any(axis=1), np.where(keep, levels, np.nan), scales
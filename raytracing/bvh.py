@@ -0,0 +1,288 @@
+import hashlib
+import os
+import numpy as np
+
+from raytracing.intersection import (
+    hit_points,
+    intersect_pairs,
+    nearest_hits,
+    triangle_arrays,
+)
+
+# Directory the built hierarchies are cached in, keyed by mesh content
+CACHE_DIR = os.environ.get(
+    "DBMAPPER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "dB-mapper")
+)
+# Bumped whenever the layout of the cached arrays changes
+CACHE_VERSION = 1
+
+# Number of rays traversed together
+RAY_CHUNK = 4096
+
+
+def surface_areas(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """
+    Surface area of each of the given axis aligned boxes
+    """
+    d = np.maximum(hi - lo, 0.0)
+    return 2.0 * (d[..., 0] * d[..., 1] + d[..., 1] * d[..., 2] + d[..., 2] * d[..., 0])
+
+
+def mesh_hash(*arrays) -> str:
+    """
+    Content hash of the given mesh arrays
+    """
+    sha = hashlib.sha1(str(CACHE_VERSION).encode())
+    for array in arrays:
+        sha.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    return sha.hexdigest()
+
+
+class BVHEngine:
+    """
+    Bounding volume hierarchy over the triangles of the model\n
+    Nodes are stored flattened: the children of an inner node are stored next to
+    each other starting at `first`, a leaf (count > 0) references `count`
+    triangles of `order` starting at `first`.
+    """
+
+    def __init__(self, v0, v1, v2, normals, leaf_size=4, bins=16, cache_dir=CACHE_DIR):
+        self.v0 = v0
+        self.v1 = v1
+        self.v2 = v2
+        self.normals = normals
+        self.edge1 = v1 - v0
+        self.edge2 = v2 - v0
+
+        key = mesh_hash(v0, v1, v2, normals, [leaf_size, bins])
+        if not self.load(cache_dir, key):
+            self.build(leaf_size, bins)
+            self.save(cache_dir, key)
+
+    @classmethod
+    def from_faces(cls, faces, **kwargs):
+        """
+        Builds the hierarchy from a list of faces
+        """
+        return cls(*triangle_arrays(faces), **kwargs)
+
+    def load(self, cache_dir, key) -> bool:
+        """
+        Loads a previously built hierarchy for this mesh from the cache
+        """
+        if cache_dir is None:
+            return False
+        try:
+            with np.load(os.path.join(cache_dir, "bvh-" + key + ".npz")) as data:
+                self.lo = data["lo"]
+                self.hi = data["hi"]
+                self.first = data["first"]
+                self.count = data["count"]
+                self.order = data["order"]
+        except (OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def save(self, cache_dir, key):
+        """
+        Stores the hierarchy in the cache
+        """
+        if cache_dir is None:
+            return
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, "bvh-" + key + ".npz")
+            np.savez(
+                path + ".tmp",
+                lo=self.lo,
+                hi=self.hi,
+                first=self.first,
+                count=self.count,
+                order=self.order,
+            )
+            os.replace(path + ".tmp.npz", path)
+        except OSError:
+            pass
+
+    def build(self, leaf_size, bins):
+        """
+        Builds the hierarchy top down using binned SAH splits
+        """
+        tri_lo = np.minimum(np.minimum(self.v0, self.v1), self.v2)
+        tri_hi = np.maximum(np.maximum(self.v0, self.v1), self.v2)
+
+        # Pad the boxes so that flat walls still have a volume to hit
+        if len(tri_lo) > 0:
+            pad = 1e-9 * max(1.0, float(np.abs(np.concatenate([tri_lo, tri_hi])).max()))
+            tri_lo = tri_lo - pad
+            tri_hi = tri_hi + pad
+        centroids = (tri_lo + tri_hi) * 0.5
+
+        order = np.arange(len(tri_lo))
+        lo, hi, first, count = [], [], [], []
+
+        def new_node():
+            lo.append(None)
+            hi.append(None)
+            first.append(0)
+            count.append(0)
+            return len(lo) - 1
+
+        stack = [(new_node(), 0, len(order))]
+        while stack:
+            node, start, end = stack.pop()
+            idx = order[start:end]
+            n = end - start
+            node_lo = tri_lo[idx].min(axis=0) if n else np.zeros(3)
+            node_hi = tri_hi[idx].max(axis=0) if n else np.zeros(3)
+            lo[node], hi[node] = node_lo, node_hi
+
+            split = None
+            if n > leaf_size:
+                split = self.find_split(tri_lo[idx], tri_hi[idx], centroids[idx], bins)
+            if split is not None:
+                # Splitting only pays off if it beats testing every triangle
+                cost, left = split
+                if cost >= n * surface_areas(node_lo, node_hi) and n <= 4 * leaf_size:
+                    split = None
+
+            if split is None:
+                first[node], count[node] = start, n
+                continue
+
+            order[start:end] = np.concatenate([idx[left], idx[~left]])
+            middle = start + int(left.sum())
+            child = new_node()
+            new_node()
+            first[node] = child
+            stack.append((child + 1, middle, end))
+            stack.append((child, start, middle))
+
+        self.lo = np.array(lo, dtype=float).reshape(-1, 3)
+        self.hi = np.array(hi, dtype=float).reshape(-1, 3)
+        self.first = np.array(first, dtype=np.int64)
+        self.count = np.array(count, dtype=np.int64)
+        self.order = order
+
+    @staticmethod
+    def find_split(tri_lo, tri_hi, centroids, bins):
+        """
+        Finds the cheapest binned SAH split of the given triangles\n
+        Returns the cost and which triangles go to the left child, or None if
+        the triangles cannot be separated.
+        """
+        c_lo = centroids.min(axis=0)
+        extent = centroids.max(axis=0) - c_lo
+
+        best = None
+        for axis in range(3):
+            if extent[axis] <= 0:
+                continue
+            bin_idx = ((centroids[:, axis] - c_lo[axis]) / extent[axis] * bins).astype(
+                np.int64
+            )
+            bin_idx = np.minimum(bin_idx, bins - 1)
+
+            counts = np.bincount(bin_idx, minlength=bins)
+            bin_lo = np.full((bins, 3), np.inf)
+            bin_hi = np.full((bins, 3), -np.inf)
+            np.minimum.at(bin_lo, bin_idx, tri_lo)
+            np.maximum.at(bin_hi, bin_idx, tri_hi)
+
+            # Bounds and counts of everything left / right of each bin boundary
+            left_n = np.cumsum(counts)[:-1]
+            left_area = surface_areas(
+                np.minimum.accumulate(bin_lo)[:-1], np.maximum.accumulate(bin_hi)[:-1]
+            )
+            right_n = np.cumsum(counts[::-1])[::-1][1:]
+            right_area = surface_areas(
+                np.minimum.accumulate(bin_lo[::-1])[::-1][1:],
+                np.maximum.accumulate(bin_hi[::-1])[::-1][1:],
+            )
+            cost = np.where(
+                (left_n > 0) & (right_n > 0),
+                left_area * left_n + right_area * right_n,
+                np.inf,
+            )
+
+            k = int(np.argmin(cost))
+            if np.isfinite(cost[k]) and (best is None or cost[k] < best[0]):
+                best = (cost[k], bin_idx <= k)
+        return best
+
+    def intersect(self, origins: np.ndarray, directions: np.ndarray) -> tuple:
+        """
+        Determines the nearest intersection of each ray with the model\n
+        Returns the face index (-1 on a miss), distance and intersection point
+        of every ray.
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        ray_count = len(origins)
+
+        face_idx = np.full(ray_count, -1, dtype=np.int64)
+        t = np.full(ray_count, np.inf)
+        if len(self.order) > 0:
+            for start in range(0, ray_count, RAY_CHUNK):
+                stop = min(start + RAY_CHUNK, ray_count)
+                face_idx[start:stop], t[start:stop] = self.traverse(
+                    origins[start:stop], directions[start:stop]
+                )
+
+        return face_idx, t, hit_points(origins, directions, t)
+
+    def traverse(self, origins, directions) -> tuple:
+        """
+        Walks all rays through the hierarchy together, one tree level at a time
+        """
+        ray_count = len(origins)
+        best_face = np.full(ray_count, -1, dtype=np.int64)
+        best_t = np.full(ray_count, np.inf)
+        with np.errstate(divide="ignore"):
+            inv_dir = 1.0 / directions
+
+        rays = np.arange(ray_count)
+        nodes = np.zeros(ray_count, dtype=np.int64)
+        while len(rays) > 0:
+            # Discard nodes that are missed or lie behind the nearest hit so far
+            with np.errstate(invalid="ignore"):
+                t1 = (self.lo[nodes] - origins[rays]) * inv_dir[rays]
+                t2 = (self.hi[nodes] - origins[rays]) * inv_dir[rays]
+            t_near = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+            t_far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+            keep = (t_far >= np.maximum(t_near, 0.0)) & (t_near <= best_t[rays])
+            rays, nodes = rays[keep], nodes[keep]
+
+            leaf = self.count[nodes] > 0
+            if leaf.any():
+                leaf_rays, leaf_nodes = rays[leaf], nodes[leaf]
+                counts = self.count[leaf_nodes]
+                pair_rays = np.repeat(leaf_rays, counts)
+                offsets = np.arange(len(pair_rays)) - np.repeat(
+                    np.cumsum(counts) - counts, counts
+                )
+                faces = self.order[np.repeat(self.first[leaf_nodes], counts) + offsets]
+
+                pair_t = intersect_pairs(
+                    origins[pair_rays],
+                    directions[pair_rays],
+                    self.v0[faces],
+                    self.v1[faces],
+                    self.v2[faces],
+                    self.edge1[faces],
+                    self.edge2[faces],
+                    self.normals[faces],
+                )
+                new_face, new_t = nearest_hits(pair_rays, faces, pair_t, ray_count)
+                better = (new_t < best_t) | (
+                    (new_t == best_t) & (new_face >= 0) & (new_face < best_face)
+                )
+                best_face[better] = new_face[better]
+                best_t[better] = new_t[better]
+
+            inner_nodes = nodes[~leaf]
+            rays = np.repeat(rays[~leaf], 2)
+            nodes = np.repeat(self.first[inner_nodes], 2)
+            nodes[1::2] += 1
+
+        return best_face, best_t
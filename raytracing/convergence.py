@@ -0,0 +1,94 @@
+import numpy as np
+
+# Two sided 95% confidence of the normal distribution
+Z_95 = 1.959964
+# Share of the intensity of the cells hit that has to be within the target error
+COVERAGE = 0.9
+# Fewest batches that have to hit a cell for its error to count, a cell hit by a
+# single batch always has an error of 10 * log10(1 + z), about 4.71 dB
+MIN_BATCHES = 2
+
+
+class Convergence:
+    """
+    Running statistics of the intensity each batch of rays adds to the cells\n
+    The batches are independent samples of the map, so the spread of what they
+    add to a cell tells how far its summed level may still be off. Only cells
+    that were hit are stored: `cells` holds their sorted ids, `moments` the
+    summed intensity and summed squared intensity of the batches for each band
+    and `hits` the number of batches that hit each cell. Batches that missed a
+    cell count as adding nothing to it.
+    """
+
+    def __init__(self, bands=1):
+        self.batches = 0
+        self.cells = np.zeros(0, dtype=np.int64)
+        self.moments = np.zeros((2, 0, bands))
+        self.hits = np.zeros(0)
+
+    def add_batch(self, cells: np.ndarray, intensity: np.ndarray):
+        """
+        Adds the (cells, bands) intensity one batch of rays added to the given
+        cells, summing the intensity of cells given more than once
+        """
+        cells, inverse = np.unique(cells, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        intensity = np.stack(
+            [
+                np.bincount(inverse, weights=intensity[:, band], minlength=len(cells))
+                for band in range(intensity.shape[1])
+            ],
+            axis=1,
+        )
+        moments = np.stack([intensity, intensity ** 2])
+        keys, inverse = np.unique(
+            np.concatenate([self.cells, cells]), return_inverse=True
+        )
+        inverse = inverse.reshape(-1)
+        summed = np.concatenate([self.moments, moments], axis=1)
+        merged = np.zeros((2, len(keys), summed.shape[2]))
+        for i in range(2):
+            for band in range(summed.shape[2]):
+                merged[i, :, band] = np.bincount(
+                    inverse, weights=summed[i, :, band], minlength=len(keys)
+                )
+        hits = np.concatenate([self.hits, np.ones(len(cells))])
+        self.hits = np.bincount(inverse, weights=hits, minlength=len(keys))
+        self.cells = keys
+        self.moments = merged
+        self.batches += 1
+
+    def cell_errors(self, z=Z_95) -> np.ndarray:
+        """
+        Returns the (cells, bands) half width in dB of the confidence interval of
+        the level of each cell, infinite where it cannot be told yet. Bands that
+        received no intensity have no error.
+        """
+        k = self.batches
+        total, squares = self.moments
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = total / k
+            variance = np.maximum(squares - k * mean ** 2, 0) / (k - 1)
+            relative = z * np.sqrt(variance / k) / mean
+            errors = 10 * np.log10(1 + relative)
+        errors = np.where(k > 1, errors, np.inf)
+        return np.where(mean > 0, errors, 0.0)
+
+    def error(self, coverage=COVERAGE, z=Z_95) -> float:
+        """
+        Returns the error in dB that the cells holding `coverage` of the intensity
+        are within, in their least certain band, out of the cells hit by at least
+        `MIN_BATCHES` batches\n
+        Cells hit by fewer batches are left out, with many small cells most of
+        them are only ever hit once and would keep the error from dropping. Cells
+        count by their intensity, so slivers of cells at the edges of the model
+        holding next to nothing do not either.
+        """
+        counted = self.hits >= MIN_BATCHES
+        if not counted.any():
+            return np.inf
+        errors = self.cell_errors(z)[counted].max(axis=1)
+        order = np.argsort(errors, kind="stable")
+        shares = np.cumsum(self.moments[0][counted].sum(axis=1)[order])
+        index = np.searchsorted(shares, coverage * shares[-1])
+        return float(errors[order][min(index, len(errors) - 1)])
@@ -0,0 +1,142 @@
+import numpy as np
+
+from formulas.db_formulas import db_to_intensity
+from raytracing.points import FLUSH_HITS
+
+# Speed of sound in air in meters per second
+SPEED_OF_SOUND = 343.0
+# Width of the arrival time bins in seconds
+BIN_WIDTH = 0.001
+# Number of time bins each cell can hold, later arrivals go in the last bin
+MAX_BINS = 1 << 20
+# Cell ids the packed (cell, bin) keys can hold without overflowing
+MAX_CELLS = np.iinfo(np.int64).max // MAX_BINS
+
+
+class Echogram:
+    """
+    Sparse histograms of the sound energy arriving at each cell over time\n
+    Every hit adds its intensity to the time bin of its cell it arrives in,
+    after travelling its distance from the sound source. Only the bins that were
+    reached are stored: `keys` holds the sorted (cell, bin) pairs packed into
+    one id and `sums` the number of hits and the summed intensity of each pair
+    and band. Hits are buffered and merged in bulk into the sorted keys, so a
+    merge costs about as much as the hits it adds.
+    """
+
+    def __init__(self, bin_width=BIN_WIDTH, bands=1):
+        self.bin_width = bin_width
+        self.bands = bands
+        self.clear()
+
+    def clear(self):
+        """
+        Removes all hits from the histograms
+        """
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((2, 0, self.bands))
+        self.pending = []
+        self.pending_count = 0
+
+    def time_bins(self, dist: np.ndarray) -> np.ndarray:
+        """
+        Bins of the arrival times of sound travelling the given distances
+        """
+        bins = np.floor(np.asarray(dist) / (SPEED_OF_SOUND * self.bin_width))
+        return np.clip(bins, 0, MAX_BINS - 1).astype(np.int64)
+
+    def add(
+        self,
+        cells: np.ndarray,
+        dist: np.ndarray,
+        levels: np.ndarray,
+        sign=1.0,
+        scales=None,
+    ):
+        """
+        Sums the (hits, bands) dB levels of hits on the given cells, arriving after
+        travelling `dist`, or takes them back out again when `sign` is -1.
+        Intensities are scaled by `scales`, if given.
+        """
+        sums = np.zeros((2,) + levels.shape)
+        sums[0][~np.isnan(levels)] = sign
+        sums[1] = sign * db_to_intensity(levels)
+        if scales is not None:
+            sums[1] *= scales
+        cells = np.asarray(cells, dtype=np.int64)
+        if len(cells) and cells.max() >= MAX_CELLS:
+            raise OverflowError(
+                "Cell ids above {} do not fit in the echogram".format(MAX_CELLS - 1)
+            )
+        self.add_sums(cells * MAX_BINS + self.time_bins(dist), sums)
+
+    def add_sums(self, keys: np.ndarray, sums: np.ndarray):
+        """
+        Buffers the sums of the given keys, merging the buffer once it is full
+        """
+        self.pending.append((keys, sums))
+        self.pending_count += len(keys)
+        if self.pending_count >= FLUSH_HITS:
+            self.flush()
+
+    def merge(self, other: "Echogram"):
+        """
+        Sums the hits of another echogram with the same bins into this one
+        """
+        other.flush()
+        self.add_sums(other.keys, other.sums)
+
+    def flush(self):
+        """
+        Merges the buffered hits into the histograms, dropping bins left without
+        a hit\n
+        Only the buffered keys are sorted, they are added to the bins already
+        there or inserted in order between them.
+        """
+        if not self.pending:
+            return
+        keys = np.concatenate([keys for keys, _ in self.pending])
+        sums = np.concatenate([sums for _, sums in self.pending], axis=1)
+        self.pending = []
+        self.pending_count = 0
+
+        keys, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        merged = np.zeros((2, len(keys), self.bands))
+        for i in range(2):
+            for band in range(self.bands):
+                merged[i, :, band] = np.bincount(
+                    inverse, weights=sums[i, :, band], minlength=len(keys)
+                )
+
+        index = np.searchsorted(self.keys, keys)
+        found = index < len(self.keys)
+        found[found] = self.keys[index[found]] == keys[found]
+        self.sums[:, index[found]] += merged[:, found]
+        new = ~found
+        self.keys = np.insert(self.keys, index[new], keys[new])
+        self.sums = np.insert(self.sums, index[new], merged[:, new], axis=1)
+
+        hit = (self.sums[0] > 0.5).any(axis=1)
+        if not hit.all():
+            self.keys = self.keys[hit]
+            self.sums = self.sums[:, hit]
+
+    def histogram(self, cells=None) -> tuple:
+        """
+        Returns the start time of each bin and the (bins, bands) intensity arriving
+        in it, summed over the given cells or over all cells when none are given
+        """
+        self.flush()
+        cells_hit, bins = np.divmod(self.keys, MAX_BINS)
+        selected = np.ones(len(bins), dtype=bool)
+        if cells is not None:
+            selected = np.isin(cells_hit, cells)
+
+        count = bins[selected].max() + 1 if selected.any() else 0
+        energy = np.zeros((count, self.bands))
+        for band in range(self.bands):
+            energy[:, band] = np.bincount(
+                bins[selected], weights=self.sums[1, selected, band], minlength=count
+            )
+        return np.arange(count) * self.bin_width, energy
@@ -0,0 +1,196 @@
+import numpy as np
+
+from formulas.geometric_formulas import calc_bounds
+from raytracing.intersection import (
+    hit_points,
+    intersect_pairs,
+    nearest_hits,
+    triangle_arrays,
+)
+
+# Target number of triangles per grid cell
+DENSITY = 3.0
+# Upper bound on the number of cells along each axis
+MAX_RESOLUTION = 128
+
+
+def grid_resolution(face_count: int, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """
+    Picks the number of cells along each axis so that the cells are roughly cubic
+    and hold about DENSITY triangles each
+    """
+    extent = np.maximum(hi - lo, 0.0)
+    longest = extent.max()
+    if face_count == 0 or longest <= 0:
+        return np.ones(3, dtype=np.int64)
+
+    # Flat scenes still need a non-zero volume to spread the triangles over
+    extent = np.maximum(extent, longest / MAX_RESOLUTION)
+    cells_per_unit = np.cbrt(DENSITY * face_count / np.prod(extent))
+    resolution = np.round(extent * cells_per_unit).astype(np.int64)
+    return np.clip(resolution, 1, MAX_RESOLUTION)
+
+
+class GridEngine:
+    """
+    Uniform voxel grid over the triangles of the model, walked with 3D-DDA\n
+    The triangles overlapping each cell are stored in `cell_faces`, starting at
+    `cell_start[cell]` and ending at `cell_start[cell + 1]`.
+    """
+
+    def __init__(self, v0, v1, v2, normals, lo=None, hi=None, resolution=None):
+        self.v0 = v0
+        self.v1 = v1
+        self.v2 = v2
+        self.normals = normals
+        self.edge1 = v1 - v0
+        self.edge2 = v2 - v0
+
+        tri_lo = np.minimum(np.minimum(v0, v1), v2)
+        tri_hi = np.maximum(np.maximum(v0, v1), v2)
+        if lo is None or hi is None:
+            lo = tri_lo.min(axis=0) if len(tri_lo) else np.zeros(3)
+            hi = tri_hi.max(axis=0) if len(tri_hi) else np.zeros(3)
+
+        # Pad the grid and triangles so faces on cell walls land in both cells
+        pad = 1e-9 * max(1.0, float(np.abs(np.concatenate([lo, hi])).max()))
+        self.lo = np.asarray(lo, dtype=float) - 2 * pad
+        self.hi = np.asarray(hi, dtype=float) + 2 * pad
+        if resolution is None:
+            resolution = grid_resolution(len(v0), self.lo, self.hi)
+        self.resolution = np.asarray(resolution, dtype=np.int64)
+        self.cell_size = (self.hi - self.lo) / self.resolution
+
+        self.build(tri_lo - pad, tri_hi + pad)
+
+    @classmethod
+    def from_faces(cls, faces, **kwargs):
+        """
+        Builds the grid from a list of faces, sized to the bounds of the model
+        """
+        lo, hi = calc_bounds(faces)
+        return cls(*triangle_arrays(faces), lo=lo.vec, hi=hi.vec, **kwargs)
+
+    def cell_coords(self, points: np.ndarray) -> np.ndarray:
+        """
+        Integer cell coordinates of the given points, clamped to the grid
+        """
+        coords = np.floor((points - self.lo) / self.cell_size).astype(np.int64)
+        return np.clip(coords, 0, self.resolution - 1)
+
+    def cell_index(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Flattened index of the cells at the given coordinates
+        """
+        nx, ny, _ = self.resolution
+        return (coords[..., 2] * ny + coords[..., 1]) * nx + coords[..., 0]
+
+    def build(self, tri_lo, tri_hi):
+        """
+        Registers every triangle with each cell its bounding box overlaps
+        """
+        first = self.cell_coords(tri_lo)
+        span = self.cell_coords(tri_hi) - first + 1
+        counts = np.prod(span, axis=1)
+
+        # One (triangle, cell) entry per overlapped cell
+        faces = np.repeat(np.arange(len(first)), counts)
+        offset = np.arange(len(faces)) - np.repeat(np.cumsum(counts) - counts, counts)
+        sx, sy = span[faces, 0], span[faces, 1]
+        coords = first[faces] + np.stack(
+            [offset % sx, (offset // sx) % sy, offset // (sx * sy)], axis=1
+        )
+        cells = self.cell_index(coords)
+
+        order = np.argsort(cells, kind="stable")
+        self.cell_faces = faces[order]
+        self.cell_start = np.zeros(np.prod(self.resolution) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(cells, minlength=np.prod(self.resolution)),
+            out=self.cell_start[1:],
+        )
+
+    def intersect(self, origins: np.ndarray, directions: np.ndarray) -> tuple:
+        """
+        Determines the nearest intersection of each ray with the model\n
+        Returns the face index (-1 on a miss), distance and intersection point
+        of every ray.
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        ray_count = len(origins)
+
+        face_idx = np.full(ray_count, -1, dtype=np.int64)
+        t = np.full(ray_count, np.inf)
+        if len(self.v0) == 0:
+            return face_idx, t, hit_points(origins, directions, t)
+
+        # Clip the rays against the grid bounds
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_dir = 1.0 / directions
+            t1 = (self.lo - origins) * inv_dir
+            t2 = (self.hi - origins) * inv_dir
+        t_enter = np.maximum(np.fmax.reduce(np.fmin(t1, t2), axis=1), 0.0)
+        t_exit = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+
+        rays = np.nonzero(t_exit >= t_enter)[0]
+        coords = self.cell_coords(
+            origins[rays] + directions[rays] * t_enter[rays, None]
+        )
+
+        # Distance to the next cell wall along each axis, and between walls
+        step = np.where(directions[rays] > 0, 1, -1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            walls = self.lo + (coords + (step > 0)) * self.cell_size
+            t_max = np.where(
+                directions[rays] != 0,
+                (walls - origins[rays]) * inv_dir[rays],
+                np.inf,
+            )
+            t_delta = np.where(
+                directions[rays] != 0, self.cell_size * np.abs(inv_dir[rays]), np.inf
+            )
+
+        while len(rays) > 0:
+            cells = self.cell_index(coords)
+            counts = self.cell_start[cells + 1] - self.cell_start[cells]
+            pair = np.repeat(np.arange(len(rays)), counts)
+            offset = np.arange(len(pair)) - np.repeat(
+                np.cumsum(counts) - counts, counts
+            )
+            faces = self.cell_faces[self.cell_start[cells][pair] + offset]
+            pair_rays = rays[pair]
+
+            pair_t = intersect_pairs(
+                origins[pair_rays],
+                directions[pair_rays],
+                self.v0[faces],
+                self.v1[faces],
+                self.v2[faces],
+                self.edge1[faces],
+                self.edge2[faces],
+                self.normals[faces],
+            )
+            cell_face, cell_t = nearest_hits(pair, faces, pair_t, len(rays))
+
+            # Only hits inside the current cell are certain to be the nearest
+            cell_exit = t_max.min(axis=1)
+            done = cell_t <= cell_exit * (1 + 1e-12) + 1e-12
+            face_idx[rays[done]] = cell_face[done]
+            t[rays[done]] = cell_t[done]
+
+            # Step into the neighbouring cell along the nearest wall
+            axis = np.argmin(t_max, axis=1)
+            moving = np.arange(len(rays))
+            coords[moving, axis] += step[moving, axis]
+            t_max[moving, axis] += t_delta[moving, axis]
+
+            active = (
+                ~done
+                & np.all((coords >= 0) & (coords < self.resolution), axis=1)
+                & (cell_exit <= t_exit[rays])
+            )
+            rays, coords = rays[active], coords[active]
+            step, t_max, t_delta = step[active], t_max[active], t_delta[active]
+
+        return face_idx, t, hit_points(origins, directions, t)
@@ -0,0 +1,183 @@
+import sys
+import numpy as np
+
+from raytracing import kernels
+
+EPSILON = sys.float_info.epsilon
+
+# Upper bound on the number of ray/triangle pairs tested in a single batch
+MAX_PAIRS = 1 << 18
+
+
+def dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Row-wise dot product of two arrays of vectors
+    """
+    return (a * b).sum(axis=-1)
+
+
+def triangle_arrays(faces) -> tuple:
+    """
+    Returns the (F, 3) arrays of the vertices and normals of a face table
+    """
+    return faces.v0, faces.v1, faces.v2, faces.normals.copy()
+
+
+def is_inside(points, v0, v1, v2, normals) -> np.ndarray:
+    """
+    Determines if the points are inside the given triangle bounds and on the same plane
+    """
+    c0 = points - v0
+    c1 = points - v1
+    c2 = points - v2
+    return (
+        (dot(normals, np.cross(v1 - v0, c0)) >= 0)
+        & (dot(normals, np.cross(v2 - v1, c1)) >= 0)
+        & (dot(normals, np.cross(v0 - v2, c2)) >= 0)
+        & (dot(c0, np.cross(c1, c2)) == 0.0)
+    )
+
+
+def intersect_pairs(origins, directions, v0, v1, v2, edge1, edge2, normals):
+    """
+    Moller-Trumbore test of each ray against its paired triangle\n
+    All arguments broadcast against each other, so either aligned (P, 3) pairs
+    or (R, 1, 3) rays against (1, F, 3) triangles may be given.
+    Returns the distance to each intersection, or infinity where there is none.
+    """
+    if kernels.enabled():
+        return compiled_pairs(origins, directions, v0, v1, v2, edge1, edge2, normals)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Check if ray is parallel to plane
+        pvec = np.cross(directions, edge2)
+        det = dot(edge1, pvec)
+        valid = (det <= -EPSILON) | (det >= EPSILON)
+
+        inv_det = 1.0 / det
+        tvec = origins - v0
+        u = dot(tvec, pvec) * inv_det
+        valid &= (u >= 0.0) & (u <= 1.0)
+
+        qvec = np.cross(tvec, edge1)
+        v = dot(directions, qvec) * inv_det
+        valid &= (v >= 0.0) & (u + v <= 1.0)
+
+        # Distance from ray origin, rays moving away from the plane are discarded
+        t = dot(edge2, qvec) * inv_det
+        valid &= t >= EPSILON
+
+    # Origin in plane
+    valid &= ~is_inside(origins, v0, v1, v2, normals)
+    return np.where(valid, t, np.inf)
+
+
+def compiled_pairs(origins, directions, *triangles) -> np.ndarray:
+    """
+    Runs `intersect_pairs` on the compiled kernel. Rays and triangles are looked
+    up by index for each pair instead of being broadcast against each other.
+    """
+    shape = np.broadcast(origins[..., 0], triangles[0][..., 0]).shape
+    rays, faces = origins.shape[:-1], triangles[0].shape[:-1]
+    ray_idx = np.arange(int(np.prod(rays))).reshape(rays)
+    face_idx = np.arange(int(np.prod(faces))).reshape(faces)
+
+    flat = [
+        np.ascontiguousarray(array, dtype=float).reshape(-1, 3)
+        for array in (origins, directions) + triangles
+    ]
+    t = np.empty(int(np.prod(shape)))
+    kernels.intersect_rays(
+        *flat,
+        np.broadcast_to(ray_idx, shape).ravel(),
+        np.broadcast_to(face_idx, shape).ravel(),
+        EPSILON,
+        t,
+    )
+    return t.reshape(shape)
+
+
+def nearest_hits(ray_idx, face_idx, t, ray_count) -> tuple:
+    """
+    Reduces candidate (ray, face, t) intersections to the nearest hit of each ray\n
+    Ties are broken by the lowest face index. Rays without a hit get a face
+    index of -1 and a distance of infinity.
+    """
+    best_face = np.full(ray_count, -1, dtype=np.int64)
+    best_t = np.full(ray_count, np.inf)
+
+    hit = np.isfinite(t)
+    ray_idx, face_idx, t = ray_idx[hit], face_idx[hit], t[hit]
+    if len(t) == 0:
+        return best_face, best_t
+
+    order = np.lexsort((face_idx, t, ray_idx))
+    ray_idx, face_idx, t = ray_idx[order], face_idx[order], t[order]
+    first = np.ones(len(ray_idx), dtype=bool)
+    first[1:] = ray_idx[1:] != ray_idx[:-1]
+
+    best_face[ray_idx[first]] = face_idx[first]
+    best_t[ray_idx[first]] = t[first]
+    return best_face, best_t
+
+
+def hit_points(origins, directions, t) -> np.ndarray:
+    """
+    Intersection points along each ray, rays without a hit are left at their origin
+    """
+    return origins + directions * np.where(np.isfinite(t), t, 0.0)[:, None]
+
+
+class BruteForceEngine:
+    """
+    Tests batches of rays against every triangle of the model at once
+    """
+
+    def __init__(self, v0, v1, v2, normals):
+        self.v0 = v0
+        self.v1 = v1
+        self.v2 = v2
+        self.normals = normals
+        self.edge1 = v1 - v0
+        self.edge2 = v2 - v0
+
+    @classmethod
+    def from_faces(cls, faces):
+        """
+        Builds the engine from a list of faces
+        """
+        return cls(*triangle_arrays(faces))
+
+    def intersect(self, origins: np.ndarray, directions: np.ndarray) -> tuple:
+        """
+        Determines the nearest intersection of each ray with the model\n
+        Returns the face index (-1 on a miss), distance and intersection point
+        of every ray.
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        ray_count = len(origins)
+        face_count = len(self.v0)
+
+        face_idx = np.full(ray_count, -1, dtype=np.int64)
+        t = np.full(ray_count, np.inf)
+        if face_count > 0:
+            chunk = max(1, MAX_PAIRS // face_count)
+            for start in range(0, ray_count, chunk):
+                stop = min(start + chunk, ray_count)
+                pair_t = intersect_pairs(
+                    origins[start:stop, None],
+                    directions[start:stop, None],
+                    self.v0[None],
+                    self.v1[None],
+                    self.v2[None],
+                    self.edge1[None],
+                    self.edge2[None],
+                    self.normals[None],
+                )
+                rows, cols = np.nonzero(np.isfinite(pair_t))
+                face_idx[start:stop], t[start:stop] = nearest_hits(
+                    rows, cols, pair_t[rows, cols], stop - start
+                )
+
+        return face_idx, t, hit_points(origins, directions, t)
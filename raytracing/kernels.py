@@ -0,0 +1,164 @@
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Backends the ray/triangle and BRDF kernels can run on
+BACKENDS = ("numpy", "numba")
+
+# Backend in use, Numba when it is installed
+backend = "numba" if numba is not None else "numpy"
+
+
+def set_backend(name: str):
+    """
+    Selects the backend the kernels run on
+    """
+    global backend
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend: {}".format(name))
+    if name == "numba" and numba is None:
+        raise ValueError("Numba is not installed")
+    backend = name
+
+
+@contextmanager
+def use_backend(name: str):
+    """
+    Runs the kernels on the given backend for the duration of a with block
+    """
+    previous = backend
+    set_backend(name)
+    try:
+        yield
+    finally:
+        set_backend(previous)
+
+
+def enabled() -> bool:
+    """
+    Whether the compiled kernels are in use
+    """
+    return backend == "numba"
+
+
+def jit(function):
+    """
+    Compiles a kernel into a parallel loop that releases the GIL, when Numba is
+    installed
+    """
+    if numba is None:
+        return function
+    return numba.njit(parallel=True, nogil=True, cache=True)(function)
+
+
+def inline(function):
+    """
+    Compiles a scalar helper of the kernels, when Numba is installed
+    """
+    if numba is None:
+        return function
+    return numba.njit(nogil=True, cache=True)(function)
+
+
+# Loops over this range run in parallel once compiled
+prange = range if numba is None else numba.prange
+
+
+@inline
+def inside(o, v0, v1, v2, n, r, f):
+    """
+    Scalar version of `is_inside` for ray `r` and triangle `f`
+    """
+    c0 = (o[r, 0] - v0[f, 0], o[r, 1] - v0[f, 1], o[r, 2] - v0[f, 2])
+    c1 = (o[r, 0] - v1[f, 0], o[r, 1] - v1[f, 1], o[r, 2] - v1[f, 2])
+    c2 = (o[r, 0] - v2[f, 0], o[r, 1] - v2[f, 1], o[r, 2] - v2[f, 2])
+    a = (v1[f, 0] - v0[f, 0], v1[f, 1] - v0[f, 1], v1[f, 2] - v0[f, 2])
+    b = (v2[f, 0] - v1[f, 0], v2[f, 1] - v1[f, 1], v2[f, 2] - v1[f, 2])
+    c = (v0[f, 0] - v2[f, 0], v0[f, 1] - v2[f, 1], v0[f, 2] - v2[f, 2])
+    m = (n[f, 0], n[f, 1], n[f, 2])
+    return (
+        triple(m, a, c0) >= 0
+        and triple(m, b, c1) >= 0
+        and triple(m, c, c2) >= 0
+        and triple(c0, c1, c2) == 0.0
+    )
+
+
+@inline
+def triple(a, b, c):
+    """
+    Scalar triple product a . (b x c)
+    """
+    x = b[1] * c[2] - b[2] * c[1]
+    y = b[2] * c[0] - b[0] * c[2]
+    z = b[0] * c[1] - b[1] * c[0]
+    return a[0] * x + a[1] * y + a[2] * z
+
+
+@jit
+def intersect_rays(o, d, v0, v1, v2, e1, e2, n, ray_idx, face_idx, eps, out):
+    """
+    Moller-Trumbore test of the rays `ray_idx` against the triangles `face_idx`,
+    writing the distance of each pair or infinity into `out`\n
+    Does the same arithmetic in the same order as `intersect_pairs`, so both
+    backends give identical results.
+    """
+    for k in prange(len(out)):
+        r = ray_idx[k]
+        f = face_idx[k]
+        out[k] = np.inf
+
+        # Check if ray is parallel to plane
+        p0 = d[r, 1] * e2[f, 2] - d[r, 2] * e2[f, 1]
+        p1 = d[r, 2] * e2[f, 0] - d[r, 0] * e2[f, 2]
+        p2 = d[r, 0] * e2[f, 1] - d[r, 1] * e2[f, 0]
+        det = e1[f, 0] * p0 + e1[f, 1] * p1 + e1[f, 2] * p2
+        if -eps < det < eps:
+            continue
+
+        inv_det = 1.0 / det
+        t0 = o[r, 0] - v0[f, 0]
+        t1 = o[r, 1] - v0[f, 1]
+        t2 = o[r, 2] - v0[f, 2]
+        u = (t0 * p0 + t1 * p1 + t2 * p2) * inv_det
+        if not (u >= 0.0 and u <= 1.0):
+            continue
+
+        q0 = t1 * e1[f, 2] - t2 * e1[f, 1]
+        q1 = t2 * e1[f, 0] - t0 * e1[f, 2]
+        q2 = t0 * e1[f, 1] - t1 * e1[f, 0]
+        v = (d[r, 0] * q0 + d[r, 1] * q1 + d[r, 2] * q2) * inv_det
+        if not (v >= 0.0 and u + v <= 1.0):
+            continue
+
+        # Distance from ray origin, rays moving away from the plane are discarded
+        t = (e2[f, 0] * q0 + e2[f, 1] * q1 + e2[f, 2] * q2) * inv_det
+        if not t >= eps:
+            continue
+
+        # Origin in plane
+        if not inside(o, v0, v1, v2, n, r, f):
+            out[k] = t
+
+
+@jit
+def phong(directions, normals, rm, v, kd, ks, out):
+    """
+    Writes the Phong weight of every hemisphere ray `v` of each hit into `out`,
+    the same way `phong_weights` calculates them
+    """
+    for h in prange(len(v)):
+        diffuse = kd[h] * (
+            directions[h, 0] * normals[h, 0]
+            + directions[h, 1] * normals[h, 1]
+            + directions[h, 2] * normals[h, 2]
+        )
+        for k in range(v.shape[1]):
+            specular = ks[h] * (
+                rm[h, 0] * v[h, k, 0] + rm[h, 1] * v[h, k, 1] + rm[h, 2] * v[h, k, 2]
+            )
+            out[h, k] = diffuse + specular
@@ -0,0 +1,223 @@
+import numpy as np
+
+from raytracing.intersection import dot
+from raytracing.points import FLUSH_HITS, level_sums, point_levels
+
+# Number of texels along the longest side of the model when no texel size is given
+TEXEL_DIVISIONS = 100
+# Most texels along each edge of a single face
+MAX_RESOLUTION = 64
+
+
+class Lightmap:
+    """
+    Per-face texel maps the dB levels of the hits are summed in\n
+    Every face is split along its barycentric coordinates into `resolution**2`
+    triangular texels about `texel_size` wide. The texels of all faces are kept
+    in one table, those of face `i` are `offsets[i]` up to `offsets[i + 1]`, so
+    memory depends on the surface area of the model and not on the number of
+    rays. `sums` holds the number of levels, the summed intensity and the summed
+    level of each texel and band, like the cells of a `PointGrid`.\n
+    Texels of a face are numbered by row along its second edge, each row holding
+    its upright texels at even and its inverted texels at odd positions.
+    """
+
+    def __init__(self, v0, edge1, edge2, texel_size=None, bands=1):
+        self.v0 = np.asarray(v0, dtype=float).reshape(-1, 3)
+        self.edge1 = np.asarray(edge1, dtype=float).reshape(-1, 3)
+        self.edge2 = np.asarray(edge2, dtype=float).reshape(-1, 3)
+        if texel_size is None:
+            corners = np.concatenate(
+                [self.v0, self.v0 + self.edge1, self.v0 + self.edge2]
+            )
+            extent = np.ptp(corners, axis=0).max() if len(corners) else 0.0
+            texel_size = max(float(extent), 1.0) / TEXEL_DIVISIONS
+        self.texel_size = texel_size
+        self.bands = bands
+
+        # A right triangle with legs of `resolution` texels has the same area
+        double_area = np.linalg.norm(np.cross(self.edge1, self.edge2), axis=1)
+        resolution = np.ceil(np.sqrt(double_area) / texel_size)
+        self.resolution = np.clip(resolution, 1, MAX_RESOLUTION).astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.resolution ** 2)])
+        self.clear()
+
+    @classmethod
+    def from_engine(cls, engine, texel_size=None, bands=1):
+        """
+        Builds the texel maps of the triangles of an intersection engine
+        """
+        return cls(engine.v0, engine.edge1, engine.edge2, texel_size, bands)
+
+    def clear(self):
+        """
+        Removes all hits from the texels
+        """
+        self.sums = np.zeros((3, self.offsets[-1], self.bands))
+        self.pending = []
+        self.pending_count = 0
+
+    def barycentric(self, points: np.ndarray, faces: np.ndarray) -> tuple:
+        """
+        Barycentric coordinates of the points along the edges of their faces,
+        clamped onto the face
+        """
+        d = points - self.v0[faces]
+        e1, e2 = self.edge1[faces], self.edge2[faces]
+        d00, d01, d11 = dot(e1, e1), dot(e1, e2), dot(e2, e2)
+        d20, d21 = dot(d, e1), dot(d, e2)
+        denom = d00 * d11 - d01 * d01
+        with np.errstate(divide="ignore", invalid="ignore"):
+            u = np.nan_to_num((d11 * d20 - d01 * d21) / denom)
+            v = np.nan_to_num((d00 * d21 - d01 * d20) / denom)
+
+        # Hits off by the rounding error of the intersection may fall just outside
+        # of their face
+        u, v = np.clip(u, 0, 1), np.clip(v, 0, 1)
+        scale = np.maximum(u + v, 1)
+        return u / scale, v / scale
+
+    def cell_ids(self, points: np.ndarray, faces: np.ndarray) -> np.ndarray:
+        """
+        Ids of the texels the given points on the given faces fall in
+        """
+        faces = np.asarray(faces, dtype=np.int64)
+        res = self.resolution[faces]
+        u, v = self.barycentric(points, faces)
+        a, b = u * res, v * res
+
+        i = np.minimum(np.floor(a).astype(np.int64), res - 1)
+        j = np.minimum(np.floor(b).astype(np.int64), res - 1 - i)
+        inverted = (a - i + b - j > 1) & (i + j < res - 1)
+        return self.offsets[faces] + j * (2 * res - j) + 2 * i + inverted
+
+    def add(self, points: np.ndarray, levels: np.ndarray, faces: np.ndarray):
+        """
+        Sums the (hits, bands) dB levels into the texels of the given points
+        """
+        self.add_cells(self.cell_ids(points, faces), levels)
+
+    def add_cells(self, cells: np.ndarray, levels: np.ndarray, sign=1.0, scales=None):
+        """
+        Sums the (hits, bands) dB levels into the given texels, or takes them back
+        out again when `sign` is -1. Intensities are scaled by `scales`, if given.
+        """
+        self.add_sums(cells, level_sums(levels, sign, scales))
+
+    def add_sums(self, cells: np.ndarray, sums: np.ndarray):
+        """
+        Buffers the sums of the given texels, merging the buffer once it is full
+        """
+        self.pending.append((cells, sums))
+        self.pending_count += len(cells)
+        if self.pending_count >= FLUSH_HITS:
+            self.flush()
+
+    def merge(self, other: "Lightmap"):
+        """
+        Sums the hits of another lightmap of the same faces into this one
+        """
+        other.flush()
+        self.flush()
+        self.sums += other.sums
+
+    def flush(self):
+        """
+        Merges the buffered hits into the texels
+        """
+        if not self.pending:
+            return
+        cells = np.concatenate([cells for cells, _ in self.pending])
+        sums = np.concatenate([sums for _, sums in self.pending], axis=1)
+        self.pending = []
+        self.pending_count = 0
+
+        for i in range(3):
+            for band in range(self.bands):
+                self.sums[i, :, band] += np.bincount(
+                    cells, weights=sums[i, :, band], minlength=self.sums.shape[1]
+                )
+
+    def texels(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Returns the (texels, 3, 3) corners of the given texels
+        """
+        faces = np.searchsorted(self.offsets, cells, side="right") - 1
+        res = self.resolution[faces]
+        local = cells - self.offsets[faces]
+
+        # Row of each texel, corrected where the square root rounded off
+        j = np.floor(res - np.sqrt(res ** 2 - local)).astype(np.int64)
+        j -= j * (2 * res - j) > local
+        j += (j + 1) * (2 * res - j - 1) <= local
+        i, inverted = np.divmod(local - j * (2 * res - j), 2)
+
+        upright = np.array([[0, 0], [1, 0], [0, 1]])
+        flipped = np.array([[1, 0], [1, 1], [0, 1]])
+        corners = np.where(inverted[:, None, None], flipped, upright)
+        corners = (corners + np.stack([i, j], axis=1)[:, None]) / res[:, None, None]
+        return (
+            self.v0[faces, None]
+            + corners[..., :1] * self.edge1[faces, None]
+            + corners[..., 1:] * self.edge2[faces, None]
+        )
+
+    def centers(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Returns the (texels, 3) centroids of the given texels
+        """
+        return self.texels(cells).mean(axis=1)
+
+    def face_levels(self, face: int) -> np.ndarray:
+        """
+        Returns the (texels, bands) dB levels of the texels of a single face, not a
+        number where a texel was not hit
+        """
+        self.flush()
+        return point_levels(self.sums[:, self.offsets[face] : self.offsets[face + 1]])
+
+    def cell_sums(self) -> tuple:
+        """
+        Returns the texels that were hit and their sums
+        """
+        self.flush()
+        hit = np.flatnonzero((self.sums[0] > 0.5).any(axis=1))
+        return hit, self.sums[:, hit]
+
+    def points(self) -> tuple:
+        """
+        Returns the corners of the texels that were hit and their dB level per band
+        """
+        hit, sums = self.cell_sums()
+        return self.texels(hit), point_levels(sums)
+
+    def save(self, filename):
+        """
+        Stores the faces and summed hits of the lightmap in a compressed file
+        """
+        self.flush()
+        np.savez_compressed(
+            filename,
+            v0=self.v0,
+            edge1=self.edge1,
+            edge2=self.edge2,
+            texel_size=self.texel_size,
+            sums=self.sums,
+        )
+
+    @classmethod
+    def load(cls, filename) -> "Lightmap":
+        """
+        Loads a lightmap stored by `save`
+        """
+        with np.load(filename) as data:
+            sums = data["sums"]
+            lightmap = cls(
+                data["v0"],
+                data["edge1"],
+                data["edge2"],
+                float(data["texel_size"]),
+                sums.shape[2],
+            )
+        lightmap.sums = sums
+        return lightmap
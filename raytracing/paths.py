@@ -0,0 +1,163 @@
+import numpy as np
+
+
+def select(order: np.ndarray, keys: np.ndarray, values) -> np.ndarray:
+    """
+    Returns the entries of `order` whose key equals any of the given values, where
+    `keys` are the keys of the entries of `order` in sorted order
+    """
+    lo = np.searchsorted(keys, values, side="left")
+    hi = np.searchsorted(keys, values, side="right")
+    lengths = hi - lo
+    starts = np.cumsum(lengths) - lengths
+    return order[np.arange(lengths.sum()) + np.repeat(lo - starts, lengths)]
+
+
+class PathCache:
+    """
+    Compact record of the paths followed by the raytracer\n
+    Every hit is stored as a node holding the node it was reflected from (-1 for
+    hits of primary rays), the face and grid cell hit, its reflection order, the dB
+    drop off along the segment leading to it and the BRDF weight of that segment.
+    Nodes are stored in the order they are hit, so parents come before their
+    children. The levels of the last evaluation are kept in `levels` so they
+    can be updated for a few faces at a time.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.count = 0
+        self.lookup = None
+        self.dist = None
+        self.levels = None
+
+    def add(self, parents, faces, cells, depth, drop_off, weights) -> np.ndarray:
+        """
+        Records the hits of one batch of rays. Returns the node of each hit.
+        """
+        nodes = np.arange(self.count, self.count + len(faces))
+        self.chunks.append(
+            (
+                np.asarray(parents, dtype=np.int64),
+                np.asarray(faces, dtype=np.int32),
+                np.asarray(cells, dtype=np.int64),
+                np.full(len(faces), depth, dtype=np.int8),
+                np.asarray(drop_off, dtype=float),
+                np.asarray(weights, dtype=float),
+            )
+        )
+        self.count += len(faces)
+        self.lookup = None
+        self.dist = None
+        self.levels = None
+        return nodes
+
+    def merge(self, other: "PathCache"):
+        """
+        Appends the paths recorded by another cache
+        """
+        offset = self.count
+        for parents, *rest in other.chunks:
+            parents = np.where(parents >= 0, parents + offset, -1)
+            self.chunks.append((parents, *rest))
+        self.count += other.count
+        self.lookup = None
+        self.dist = None
+        self.levels = None
+
+    def arrays(self) -> tuple:
+        """
+        Returns the parents, faces, cells, depths, drop offs and weights of all
+        the nodes, consolidating the recorded batches into single arrays
+        """
+        if len(self.chunks) == 0:
+            self.add([], [], [], 0, [], [])
+        if len(self.chunks) > 1:
+            columns = zip(*self.chunks)
+            self.chunks = [tuple(np.concatenate(column) for column in columns)]
+        return self.chunks[0]
+
+    def index(self) -> tuple:
+        """
+        Returns the nodes sorted by the face they hit and by their parent, each
+        with its sorted keys. Kept until more paths are recorded.
+        """
+        if self.lookup is None:
+            parents, faces = self.arrays()[:2]
+            by_face = np.argsort(faces, kind="stable")
+            by_parent = np.argsort(parents, kind="stable")
+            self.lookup = (by_face, faces[by_face], by_parent, parents[by_parent])
+        return self.lookup
+
+    def distances(self) -> np.ndarray:
+        """
+        Returns the distance each node is from the sound source along its path,
+        recovered from the drop offs of the segments leading to it. Primary rays
+        start 1 unit from the source. Kept until more paths are recorded.
+        """
+        if self.dist is None:
+            parents, _, _, depth, drop_off, _ = self.arrays()
+            dist = np.ones(len(parents))
+            for order in range(depth.max() + 1 if len(depth) else 0):
+                nodes = np.flatnonzero(depth == order)
+                if order > 0:
+                    dist[nodes] = dist[parents[nodes]]
+                dist[nodes] *= 10 ** (drop_off[nodes] / 20)
+            self.dist = dist
+        return self.dist
+
+    def evaluate(self, start_db: float, absorption: np.ndarray, cutoff=0.0):
+        """
+        Calculates the dB level of every band at each node for the given start
+        level and (faces, bands) absorption table\n
+        Levels are rebuilt one reflection order at a time: the level leaving a
+        node is its level after absorption times the BRDF weight of the segment,
+        less the drop off along it. Segments leaving at or below `cutoff` are not
+        followed, so their nodes and all nodes after them are not a number.
+        """
+        parents, faces, _, depth, drop_off, weights = self.arrays()
+        levels = np.full((len(faces), absorption.shape[1]), np.nan)
+
+        for order in range(depth.max() + 1 if len(depth) else 0):
+            nodes = np.flatnonzero(depth == order)
+            if order == 0:
+                leaving = np.full((len(nodes), levels.shape[1]), float(start_db))
+            else:
+                parent = parents[nodes]
+                reflected = levels[parent] * (1 - absorption[faces[parent]])
+                leaving = reflected * weights[nodes, None]
+                leaving[~(leaving > cutoff)] = np.nan
+            levels[nodes] = leaving - drop_off[nodes, None]
+
+        self.levels = levels
+        return levels
+
+    def update_faces(self, changed, absorption: np.ndarray, cutoff=0.0) -> tuple:
+        """
+        Updates the levels of the last evaluation after the absorption of the
+        `changed` faces has changed. Only the nodes reflected off a hit on one of
+        those faces, and the nodes after them, are recalculated.\n
+        Returns the updated nodes with their previous and new levels. A node may be
+        updated more than once when its path hits the changed faces repeatedly,
+        the differences of all its updates add up to its total change.
+        """
+        parents, faces, _, _, drop_off, weights = self.arrays()
+        by_face, face_keys, by_parent, parent_keys = self.index()
+
+        bands = absorption.shape[1]
+        nodes = [np.zeros(0, dtype=np.int64)]
+        old, new = [np.zeros((0, bands))], [np.zeros((0, bands))]
+        frontier = select(by_parent, parent_keys, select(by_face, face_keys, changed))
+        while len(frontier):
+            parent = parents[frontier]
+            reflected = self.levels[parent] * (1 - absorption[faces[parent]])
+            leaving = reflected * weights[frontier, None]
+            leaving[~(leaving > cutoff)] = np.nan
+
+            nodes.append(frontier)
+            old.append(self.levels[frontier])
+            self.levels[frontier] = leaving - drop_off[frontier, None]
+            new.append(self.levels[frontier])
+            frontier = select(by_parent, parent_keys, frontier)
+
+        return np.concatenate(nodes), np.concatenate(old), np.concatenate(new)
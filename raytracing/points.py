@@ -0,0 +1,167 @@
+import numpy as np
+
+from formulas.db_formulas import db_to_intensity, intensity_to_db
+
+# Number of cells along the longest side of the model when no cell size is given,
+# like the texels of a `Lightmap`. Finer cells show more detail, but every cell
+# gets fewer hits, so the map is noisier and more cells have to be stored and
+# merged for the same number of rays.
+CELL_DIVISIONS = 100
+# Number of buffered hits after which they are merged into the grid
+FLUSH_HITS = 1 << 20
+
+
+def level_sums(levels: np.ndarray, sign=1.0, scales=None) -> np.ndarray:
+    """
+    Converts (hits, bands) dB levels into the number of levels, the intensity and
+    the level each hit adds to its cell. Levels that are not a number add nothing.
+    The intensities are multiplied by the linear `scales` of the hits, if given.
+    """
+    valid = ~np.isnan(levels)
+    sums = np.zeros((3,) + levels.shape)
+    sums[0][valid] = sign
+    sums[1] = sign * db_to_intensity(levels)
+    sums[2][valid] = sign * levels[valid]
+    if scales is not None:
+        sums[1] *= scales
+        sums[2][valid] += sign * 10 * np.log10(scales[valid])
+    return sums
+
+
+def point_levels(sums: np.ndarray) -> np.ndarray:
+    """
+    Converts the sums of a cell into its dB level. A cell hit once keeps the level
+    of the hit, the levels of a cell hit more than once are summed like
+    `sum_levels` does. Cells without a hit are not a number.
+    """
+    count, intensity, total = sums
+    # Every positive level adds an intensity of about 1 or more, anything less is
+    # silent or left over from levels taken back out of the cell
+    summed = intensity_to_db(np.where(intensity > 0.5, intensity, 0.0))
+    levels = np.where(count > 1, summed, total)
+    return np.where(count > 0.5, levels, np.nan)
+
+
+class PointGrid:
+    """
+    Hashed grid of cubic cells the dB levels of the hits are summed in\n
+    Cells are `cell_size` wide and centered on multiples of it. Only cells that
+    were hit are stored: `cells` holds their sorted ids and `sums` the number of
+    levels, the summed intensity and the summed level of each cell and band.
+    Hits are buffered and merged in bulk, so memory depends on the number of cells
+    hit and not on the number of rays.
+    """
+
+    def __init__(self, lo, hi, cell_size=None, bands=1):
+        lo = np.asarray(lo, dtype=float)
+        hi = np.asarray(hi, dtype=float)
+        if cell_size is None:
+            cell_size = max(float((hi - lo).max()), 1.0) / CELL_DIVISIONS
+        self.cell_size = cell_size
+        self.bands = bands
+
+        # Padded so rounding never moves a hit off the grid
+        self.origin = np.floor(lo / cell_size).astype(np.int64) - 1
+        self.dims = np.ceil(hi / cell_size).astype(np.int64) + 2 - self.origin
+        self.clear()
+
+    @classmethod
+    def from_engine(cls, engine, cell_size=None, bands=1):
+        """
+        Builds a grid spanning the triangles of an intersection engine
+        """
+        corners = np.concatenate([engine.v0, engine.v1, engine.v2])
+        lo = corners.min(axis=0) if len(corners) else np.zeros(3)
+        hi = corners.max(axis=0) if len(corners) else np.zeros(3)
+        return cls(lo, hi, cell_size, bands)
+
+    def clear(self):
+        """
+        Removes all hits from the grid
+        """
+        self.cells = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((3, 0, self.bands))
+        self.pending = []
+        self.pending_count = 0
+
+    def cell_ids(self, points: np.ndarray, faces=None) -> np.ndarray:
+        """
+        Ids of the cells the given points fall in, whichever faces they are on
+        """
+        coords = np.around(points / self.cell_size).astype(np.int64) - self.origin
+        coords = np.clip(coords, 0, self.dims - 1)
+        return np.ravel_multi_index(tuple(coords.T), self.dims)
+
+    def add(self, points: np.ndarray, levels: np.ndarray, faces=None):
+        """
+        Sums the (hits, bands) dB levels into the cells of the given points
+        """
+        self.add_cells(self.cell_ids(points), levels)
+
+    def add_cells(self, cells: np.ndarray, levels: np.ndarray, sign=1.0, scales=None):
+        """
+        Sums the (hits, bands) dB levels into the given cells, or takes them back
+        out again when `sign` is -1. Intensities are scaled by `scales`, if given.
+        """
+        self.add_sums(cells, level_sums(levels, sign, scales))
+
+    def add_sums(self, cells: np.ndarray, sums: np.ndarray):
+        """
+        Buffers the sums of the given cells, merging the buffer once it is full
+        """
+        self.pending.append((cells, sums))
+        self.pending_count += len(cells)
+        if self.pending_count >= FLUSH_HITS:
+            self.flush()
+
+    def merge(self, other: "PointGrid"):
+        """
+        Sums the hits of another grid with the same layout into this one
+        """
+        other.flush()
+        self.add_sums(other.cells, other.sums)
+
+    def flush(self):
+        """
+        Merges the buffered hits into the grid, dropping cells left without a hit
+        """
+        if not self.pending:
+            return
+        cells = np.concatenate([self.cells] + [cells for cells, _ in self.pending])
+        sums = np.concatenate([self.sums] + [sums for _, sums in self.pending], axis=1)
+        self.pending = []
+        self.pending_count = 0
+
+        keys, inverse = np.unique(cells, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        merged = np.zeros((3, len(keys), self.bands))
+        for i in range(3):
+            for band in range(self.bands):
+                merged[i, :, band] = np.bincount(
+                    inverse, weights=sums[i, :, band], minlength=len(keys)
+                )
+
+        hit = (merged[0] > 0.5).any(axis=1)
+        self.cells = keys[hit]
+        self.sums = merged[:, hit]
+
+    def cell_sums(self) -> tuple:
+        """
+        Returns the cells that were hit and their sums
+        """
+        self.flush()
+        return self.cells, self.sums
+
+    def centers(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Returns the (cells, 3) centers of the given cells
+        """
+        coords = np.stack(np.unravel_index(cells, self.dims), axis=1)
+        return ((coords + self.origin) * self.cell_size).reshape(-1, 3)
+
+    def points(self) -> tuple:
+        """
+        Returns the centers of the cells that were hit and their dB level per band
+        """
+        self.flush()
+        return self.centers(self.cells), point_levels(self.sums)
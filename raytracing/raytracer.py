@@ -1,173 +1,606 @@
 import OpenGL.GL as gl
-import numpy as np
 import math
-import random
-import sys
+import numpy as np
+import time
+import multiprocessing
+import warnings
 
 from fileloader import ObjLoader
 from geometry.vec3 import Vec3
-from geometry.face import Face
-from geometry.ray import Ray
-from formulas.db_formulas import drop_off, sum_levels, db_to_color
-from raytracing.brdf import generate_brdf
+from geometry.face_table import FaceTable
+from geometry.ray import RayBatch
+from formulas.db_formulas import (
+    drop_off,
+    db_to_color,
+    schroeder,
+    edt,
+    t20,
+    t30,
+    clarity,
+)
+from raytracing.brdf import HEMISPHERE_RAYS, generate_brdf, sample_brdf, terminate
+from raytracing.intersection import BruteForceEngine
+from raytracing.bvh import BVHEngine
+from raytracing.grid import GridEngine
+from raytracing.shared import share_attributes, unshare_attributes
+from raytracing.paths import PathCache
+from raytracing.points import PointGrid
+from raytracing.lightmap import Lightmap
+from raytracing.echogram import Echogram
+from raytracing.convergence import Convergence
+from raytracing.sampler import sphere_directions
+from raytracing import kernels
 from geometry.materials import Materials as mtl
 
+# Intersection engines the raytracer can be run with
+ENGINES = {
+    "brute": BruteForceEngine,
+    "bvh": BVHEngine,
+    "grid": GridEngine,
+}
+
+# Maps the levels of the hits can be summed in
+HIT_MAPS = {
+    "points": PointGrid,
+    "lightmap": Lightmap,
+}
+
+# Distance along the normal reflected rays leave their surface from, so they do
+# not hit the surface they are leaving again
+SURFACE_OFFSET = 1e-6
+# Maximum number of rays intersected together in one wavefront
+BATCH_SIZE = 4096
+# Number of chunks the primary rays are split into per worker process
+CHUNKS_PER_WORKER = 4
+# Number of rays, reflections included, traced per batch when tracing until the
+# map has converged
+ADAPTIVE_RAYS = 100000
+# Number of regions along the longest side of the model the error of an adaptive
+# trace is estimated over. Cells are too small for it: the few direct hits each
+# cell gets dominate its level, so its error stays high however long it is traced
+REGION_DIVISIONS = 10
+# Fewest reflection orders for the traced decay to stand in for the reverberation
+# of the room, fewer orders only give the early part of the decay
+MIN_DECAY_REFLECTIONS = 8
+# Level in dB the Schroeder curve has to reach for a T30
+T30_RANGE = -35
+
+# Tracer of the current worker process during a parallel trace
+worker_tracer = None
+
+
+def init_worker(tracer, backend):
+    """
+    Sets up a worker process with the tracer it traces rays for and the backend
+    of its kernels
+    """
+    global worker_tracer
+    worker_tracer = tracer
+    kernels.set_backend(backend)
+
+
+def trace_chunk(directions: np.ndarray, seed: int) -> tuple:
+    """
+    Traces a chunk of the primary rays in a worker process.
+    Returns which of the rays hit the model, the grid and echogram of the hits
+    and the paths recorded for the chunk.
+    """
+    np.random.seed(seed)
+    worker_tracer.reset_points()
+    if worker_tracer.paths is not None:
+        worker_tracer.paths = PathCache()
+    success = worker_tracer.trace(directions)
+    worker_tracer.grid.flush()
+    return success, worker_tracer.grid, worker_tracer.echogram, worker_tracer.paths
+
 
 class RayTracer:
     def __init__(
         self,
         origin: Vec3,
         ray_num: int,
-        faces: np.ndarray,
+        faces: FaceTable,
         start_db=120.0,
         freq=1000,
         reflections=0,
+        engine="bvh",
+        batch_size=BATCH_SIZE,
+        dynamic_range=None,
+        roulette_range=None,
+        brdf_samples=None,
+        workers=None,
+        run=True,
+        bands=None,
+        record_paths=False,
+        cell_size=None,
+        hit_map="points",
+        record_echogram=False,
+        target_db=None,
+        time_budget=None,
     ):
         self.origin = origin
         self.ray_num = ray_num
         self.faces = faces
-        self.start_db = start_db
         self.freq = freq
-        self.point_dict = dict()
+        self.reflections = reflections
+        self.batch_size = batch_size
+        self.brdf_samples = brdf_samples
+        self.dynamic_range = dynamic_range
+        self.roulette_range = roulette_range
+
+        # When a target error in dB or a time budget in seconds is given, rays are
+        # traced in batches until the map is that certain or the time is up, with
+        # `ray_num` rays at most. The error reached is kept in `error` and whether
+        # it is within the target in `converged`.
+        self.target_db = target_db
+        self.time_budget = time_budget
+        self.error = None
+        self.converged = False
+        # Called while tracing, the trace ends early once it returns True
+        self.stop = None
+
+        # Frequency bands traced together, every ray carries a level per band
+        self.bands = [freq] if bands is None else list(bands)
+        self.engine = ENGINES[engine].from_faces(faces)
+
+        # Hits are summed in the cells or texels of the hit map, `cell_size` wide
+        self.hit_map = HIT_MAPS[hit_map]
+        self.cell_size = cell_size
+        # Arrival times of the hits are binned per cell when recording echograms
+        self.record_echogram = record_echogram
+        self.reset_points()
+        self.set_start_db(start_db)
+        self.set_surfaces()
+
+        # The levels along recorded paths can be re-evaluated without tracing,
+        # which needs the levels to follow from the path alone
+        self.paths = None
+        if record_paths:
+            if brdf_samples is not None or roulette_range is not None:
+                raise ValueError("Sampled or roulette traces cannot record paths")
+            self.paths = PathCache()
+
+        # Left to the caller when the rays are traced step by step
+        if run:
+            self.run(workers)
+
+    def __getstate__(self):
+        """
+        Worker processes only need the tracing state, not the faces or the points
+        """
+        state = self.__dict__.copy()
+        state["faces"] = None
+        state["grid"] = None
+        state["stop"] = None
+        state["echogram"] = None
+        state["paths"] = None if self.paths is None else PathCache()
+        return state
+
+    def set_start_db(self, start_db):
+        """
+        Sets the level of the sound source. Reflected rays `dynamic_range` below it
+        are dropped and rays `roulette_range` below it play russian roulette, no
+        limit is applied when a range is not given.
+        """
+        self.start_db = start_db
+        self.cutoff = 0.0
+        if self.dynamic_range is not None:
+            self.cutoff = max(0.0, start_db - self.dynamic_range)
+        self.roulette = None
+        if self.roulette_range is not None:
+            self.roulette = start_db - self.roulette_range
+
+    def set_surfaces(self):
+        """
+        Reads the surface properties of the faces, looked up by face index for
+        every hit
+        """
+        self.kd = self.faces.kd.copy()
+        self.ks = self.faces.ks.copy()
+        self.materials = self.faces.materials.copy()
+        self.absorption = mtl.absorption(self.materials, self.bands).reshape(
+            -1, len(self.bands)
+        )
+
+    def reevaluate(self, start_db=None, freq=None):
+        """
+        Recalculates the decibel map from the recorded paths for the current
+        materials of the faces and the given start level and frequency, without
+        tracing any rays. Paths dropped during the trace are not brought back.\n
+        When only the materials of some faces changed since the last evaluation,
+        only the paths reflected off those faces are recalculated: their old
+        levels are taken out of the grid and their new levels added.
+        """
+        if self.paths is None:
+            raise ValueError("No paths were recorded to re-evaluate")
+        rebuild = self.paths.levels is None
+        if start_db is not None:
+            self.set_start_db(start_db)
+            rebuild = True
+        if freq is not None:
+            self.freq = freq
+            if freq not in self.bands:
+                self.bands = [freq]
+            rebuild = True
+        absorption = self.absorption
+        self.set_surfaces()
+
+        cells = self.paths.arrays()[2]
+        dist = self.paths.distances() if self.echogram is not None else None
+        if rebuild:
+            levels = self.paths.evaluate(self.start_db, self.absorption, self.cutoff)
+            self.reset_points()
+            self.grid.add_cells(cells, levels)
+            if self.echogram is not None:
+                self.echogram.add(cells, dist, levels)
+        else:
+            changed = np.flatnonzero((self.absorption != absorption).any(axis=1))
+            nodes, old, new = self.paths.update_faces(
+                changed, self.absorption, self.cutoff
+            )
+            self.grid.add_cells(cells[nodes], old, sign=-1.0)
+            self.grid.add_cells(cells[nodes], new)
+            if self.echogram is not None:
+                self.echogram.add(cells[nodes], dist[nodes], old, sign=-1.0)
+                self.echogram.add(cells[nodes], dist[nodes], new)
+
+    def reset_points(self):
+        """
+        Clears the hits summed for every band. The band of `freq` is shown, or the
+        first band when `freq` is not one of the bands.
+        """
+        self.grid = self.hit_map.from_engine(
+            self.engine, self.cell_size, len(self.bands)
+        )
+        self.echogram = None
+        if self.record_echogram:
+            self.echogram = Echogram(bands=len(self.bands))
+        self.band = self.bands.index(self.freq) if self.freq in self.bands else 0
+
+    def points(self) -> tuple:
+        """
+        Returns the centers of the cells, or the corners of the texels, that were
+        hit and their dB level in the band shown
+        """
+        centers, levels = self.grid.points()
+        levels = levels[:, self.band]
+        hit = ~np.isnan(levels)
+        return centers[hit], levels[hit]
+
+    def decay(self, cells=None) -> dict:
+        """
+        Returns the early decay time, the T20 and T30 reverberation times and the
+        C50 and C80 clarity of the band shown, from the echogram of the given
+        cells or of all cells when none are given
+        """
+        if self.echogram is None:
+            raise ValueError("No echogram was recorded")
+        times, energy = self.echogram.histogram(cells)
+        energy = energy[:, self.band]
+        return {
+            "EDT": edt(times, energy),
+            "T20": t20(times, energy),
+            "T30": t30(times, energy),
+            "C50": clarity(times, energy, 0.05),
+            "C80": clarity(times, energy, 0.08),
+        }
 
-        for ray in self.generate_rays():
-            success = self.intersect(ray, reflections)
-            if not success:
-                print("Error")
+    def reverberation(self) -> float:
+        """
+        Returns the T30 of the band shown from the echogram of all cells, or not a
+        number when the trace has no usable decay tail: fewer than
+        `MIN_DECAY_REFLECTIONS` reflection orders were traced or the decay curve
+        does not reach `T30_RANGE` before the last arrival
+        """
+        if self.echogram is None or self.reflections < MIN_DECAY_REFLECTIONS:
+            return math.nan
+        times, energy = self.echogram.histogram()
+        energy = energy[:, self.band]
+        curve = schroeder(energy)
+        if not np.any(np.isfinite(curve) & (curve <= T30_RANGE)):
+            return math.nan
+        return t30(times, energy)
+
+    def run(self, workers=None):
+        """
+        Traces all the rays leaving the sound source, in parallel if more than one
+        worker process is given
+        """
+        if self.target_db is not None or self.time_budget is not None:
+            for _ in self.run_steps(self.step_size(ADAPTIVE_RAYS)):
+                pass
+            return
+        if workers is not None and workers > 1:
+            hits = self.trace_parallel(self.generate_rays(), workers)
+        else:
+            hits = self.trace(self.generate_rays())
+        self.check_hits(hits)
+
+    def run_steps(self, step: int):
+        """
+        Traces the rays leaving the sound source `step` rays at a time, yielding the
+        number of rays traced after each step so partial results can be shown
+        """
+        if self.target_db is not None or self.time_budget is not None:
+            yield from self.run_adaptive(step)
+            return
+        directions = self.generate_rays()
+        for start in range(0, len(directions), step):
+            self.check_hits(self.trace(directions[start : start + step]))
+            yield min(start + step, len(directions))
+
+    def run_adaptive(self, step: int):
+        """
+        Traces batches of `step` rays leaving the sound source in every direction
+        until `target_db` is reached, `time_budget` runs out or `ray_num` rays are
+        traced, yielding the number of rays traced after each batch\n
+        The intensity each batch adds to the regions of `REGION_DIVISIONS` is
+        tracked, the error of the map is the half width of the 95% confidence
+        interval of the region levels.
+        The time budget is checked between batches, so every batch is traced with
+        all its reflections. `step_size` gives batches that fit the reflections.
+        """
+        start = time.time()
+        corners = np.concatenate([self.engine.v0, self.engine.v1, self.engine.v2])
+        extent = np.ptp(corners, axis=0).max() if len(corners) else 0.0
+        regions = PointGrid.from_engine(
+            self.engine, max(float(extent), 1.0) / REGION_DIVISIONS
+        )
+        convergence = Convergence(len(self.bands))
+        self.converged = False
+        done = 0
+        while done < self.ray_num:
+            count = min(step, self.ray_num - done)
+
+            # Trace the batch into a map of its own to see what it adds
+            grid = self.grid
+            self.grid = self.hit_map.from_engine(
+                self.engine, self.cell_size, len(self.bands)
+            )
+            hits = self.trace(self.generate_rays(count))
+            self.check_hits(hits)
+            batch, self.grid = self.grid, grid
+            self.grid.merge(batch)
+            cells, sums = batch.cell_sums()
+            region_ids = regions.cell_ids(batch.centers(cells))
+            convergence.add_batch(region_ids, sums[1])
+
+            done += len(hits)
+            self.error = convergence.error()
+            yield done
+
+            if self.target_db is not None and self.error <= self.target_db:
+                self.converged = True
+                break
+            if self.time_budget is not None:
+                if time.time() - start >= self.time_budget:
+                    break
+            if self.stopped():
+                break
+
+    def step_size(self, rays: int) -> int:
+        """
+        Number of rays leaving the sound source whose paths hold about `rays` rays
+        when every reflection order is traced in full
+        """
+        per_hit = HEMISPHERE_RAYS + 1
+        if self.brdf_samples is not None:
+            per_hit = self.brdf_samples + 1
+        per_ray = sum(per_hit ** order for order in range(self.reflections + 1))
+        return max(1, rays // per_ray)
+
+    def check_hits(self, hits: np.ndarray):
+        """
+        Warns when rays leaving the sound source missed the model, which happens
+        when the source is outside of the model or the model has holes
+        """
+        missed = np.count_nonzero(~hits)
+        if missed:
+            warnings.warn(
+                "{} of {} rays missed the model".format(missed, len(hits)),
+                RuntimeWarning,
+            )
 
-    def render(self):
+    def stopped(self) -> bool:
+        """
+        Whether the trace should end early, as asked for by `stop`
+        """
+        return self.stop is not None and self.stop()
+
+    def render(self, points=None):
         """
         Returns a renderable calllist of the points generated by raytracing the model.
+        A snapshot of the points may be given to render a trace still in progress.
+        Texels of a lightmap are drawn as triangles on top of their faces.
         """
+        centers, levels = self.points() if points is None else points
+        order = np.argsort(-levels, kind="stable")
+        centers, levels = centers[order], levels[order]
+
+        # Louder points are drawn more opaque
+        colors = db_to_color(levels).reshape(-1, 3)
+        alphas = np.select(
+            [levels > 100, levels > 80, levels > 60, levels > 40],
+            [1, 0.65, 0.25, 0.125],
+            0.0625,
+        )
         gl_list = gl.glGenLists(1)
         gl.glNewList(gl_list, gl.GL_COMPILE)
         gl.glShadeModel(gl.GL_SMOOTH)
-        gl.glPointSize(5)
-        gl.glBegin(gl.GL_POINTS)
-        for vec, dB in sorted(
-            self.point_dict.items(), key=lambda item: item[1], reverse=True
-        ):
-            if dB > 100:
-                gl.glColor4f(*db_to_color(dB), 1)
-            elif dB > 80:
-                gl.glColor4f(*db_to_color(dB), 0.65)
-            elif dB > 60:
-                gl.glColor4f(*db_to_color(dB), 0.25)
-            elif dB > 40:
-                gl.glColor4f(*db_to_color(dB), 0.125)
-            else:
-                gl.glColor4f(*db_to_color(dB), 0.0625)
-
-            gl.glVertex3fv(vec)
+        # Texels are filled whatever polygon mode the model was drawn with, the
+        # mode and offset are restored afterwards
+        gl.glPushAttrib(gl.GL_POLYGON_BIT)
+        if centers.ndim == 3:
+            gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_FILL)
+            gl.glEnable(gl.GL_POLYGON_OFFSET_FILL)
+            gl.glPolygonOffset(-1, -1)
+            gl.glBegin(gl.GL_TRIANGLES)
+        else:
+            gl.glPointSize(5)
+            gl.glBegin(gl.GL_POINTS)
+        for corners, color, alpha in zip(centers, colors, alphas):
+            gl.glColor4f(*color, alpha)
+            for vec in corners.reshape(-1, 3):
+                gl.glVertex3fv(vec)
         gl.glEnd()
+        gl.glPopAttrib()
         gl.glEndList()
         return gl_list
 
-    def generate_rays(self) -> list:
+    def generate_rays(self, ray_num=None) -> np.ndarray:
         """
-        Generates an array of rays to use for the raytracing
+        Generates the directions of the rays to use for the raytracing, `ray_num`
+        of them spread over the whole sphere
         """
-        rnd = random.random() * self.ray_num
-
-        points = []
-        offset = 2.0 / self.ray_num
-        increment = math.pi * (3.0 - math.sqrt(5.0))
+        return sphere_directions(self.ray_num if ray_num is None else ray_num)
 
-        for i in range(self.ray_num):
-            y = ((i * offset) - 1) + (offset / 2)
-            r = math.sqrt(1 - pow(y, 2))
+    def trace(self, directions: np.ndarray) -> np.ndarray:
+        """
+        Traces rays leaving the sound source in the given directions.
+        Returns which of the rays hit the model.
+        """
+        hits = [np.zeros(0, dtype=bool)]
+        for start in range(0, len(directions), self.batch_size):
+            if self.stopped():
+                break
+            batch = directions[start : start + self.batch_size]
+            rays = RayBatch(
+                np.tile(self.origin.vec, (len(batch), 1)),
+                batch,
+                np.ones(len(batch)),
+                np.full((len(batch), len(self.bands)), float(self.start_db)),
+            )
+            hits.append(self.intersect(rays, self.reflections))
+        return np.concatenate(hits)
 
-            phi = ((i + rnd) % self.ray_num) * increment
+    def trace_parallel(self, directions: np.ndarray, workers: int) -> np.ndarray:
+        """
+        Traces rays leaving the sound source across a pool of worker processes.
+        The face tables of the tracer and its engine are moved into shared memory
+        for the duration of the trace, so the workers attach to them instead of
+        receiving copies. Every worker logs its points separately, they are merged
+        into the grid once the pool is done. Returns which of the rays hit the
+        model.
+        """
+        chunks = np.array_split(directions, workers * CHUNKS_PER_WORKER)
+        seeds = np.random.randint(2 ** 31, size=len(chunks))
 
-            x = math.cos(phi) * r
-            z = math.sin(phi) * r
+        hits = [np.zeros(0, dtype=bool)]
+        shared = share_attributes(self, self.engine)
+        try:
+            initargs = (self, kernels.backend)
+            with multiprocessing.Pool(workers, init_worker, initargs) as pool:
+                results = pool.starmap(trace_chunk, zip(chunks, seeds))
+        finally:
+            unshare_attributes(shared)
 
-            points.append(Ray(self.origin, Vec3(x, y, z).normalize(), 1, self.start_db))
-        return points
+        for success, grid, echogram, paths in results:
+            hits.append(success)
+            self.grid.merge(grid)
+            if echogram is not None:
+                self.echogram.merge(echogram)
+            if paths is not None:
+                self.paths.merge(paths)
+        return np.concatenate(hits)
 
-    def intersect(self, ray: Ray, rNum=0) -> bool:
+    def intersect(self, rays: RayBatch, rNum=0):
         """
-        Determines the intersection point of the given ray for the current model
+        Determines the intersection points of the given rays for the current model
+        and logs the dB level at each. Returns which of the given rays hit the model.\n
+        Every ray carries a dB level per frequency band, bands a ray no longer
+        carries are not a number.\n
+        Reflections are traced as wavefronts: every batch is intersected at once and
+        its reflected rays are queued as batches of the next reflection order. The
+        most recently queued batch is traced first, so the rays waiting per
+        reflection order are at most the reflections of one batch: `batch_size`
+        times the rays per hit, which is 101 for the whole hemisphere or
+        `brdf_samples` + 1. Rays still waiting are dropped once the trace is
+        stopped.
+        When paths are recorded every ray also carries the BRDF weight it left its
+        hit with and the node of that hit.
         """
-        EPSILON = sys.float_info.epsilon
-        for face in self.faces:
-            # Origin in plane
-            if self.is_inside(ray.origin, *face.vertices, face.normal):
-                continue
-
-            # Check if ray is parallel to plane
-            pvec = ray.direction.cross(face.edge2)
-            det = face.edge1.dot(pvec)
-            if det > -EPSILON and det < EPSILON:
-                continue
+        weights, parents = np.ones(len(rays)), np.full(len(rays), -1)
+        queue = [(rays, weights, parents, rNum)]
+        success = None
+        while queue:
+            if success is not None and self.stopped():
+                break
+            rays, weights, parents, rNum = queue.pop()
+            face_idx, _, points = self.engine.intersect(rays.origins, rays.directions)
 
-            inv_det = 1.0 / det
-            tvec = ray.origin.sub(face.vertices[0])
-            u = tvec.dot(pvec) * inv_det
-            if u < 0.0 or u > 1.0:
-                continue
+            hit = face_idx >= 0
+            if success is None:
+                success = hit
+            face_idx, points = face_idx[hit], points[hit]
+            rays, weights, parents = rays[hit], weights[hit], parents[hit]
+            origins, directions = rays.origins, rays.directions
+            dist_from_origin, start_db = rays.dist_from_origin, rays.levels
 
-            qvec = tvec.cross(face.edge1)
-            v = ray.direction.dot(qvec) * inv_det
-            if v < 0.0 or u + v > 1.0:
-                continue
+            # Intersection points, binned into cells of `cell_size` by the hit map
+            phit = points
 
-            # Distance from ray origin
-            t = face.edge2.dot(qvec) * inv_det
-            # Ray moves away from the plane
-            if t < EPSILON:
-                continue
+            # Calcualate the dB level at the intersections
+            new_dist_from_origin = dist_from_origin + np.linalg.norm(
+                phit - origins, axis=1
+            )
+            db_change = drop_off(dist_from_origin, new_dist_from_origin)
+            point_db = start_db - db_change[:, None]
 
-            # Intersection point
-            phit_long = ray.origin.add(Vec3(*(ray.direction * t)))
-            phit = Vec3(*np.around(phit_long.vec, decimals=2))
-
-            # Calcualate the dB level at the intersection
-            new_dist_from_origin = ray.dist_from_origin + ray.origin.distance(phit)
-            db_change = drop_off(ray.dist_from_origin, new_dist_from_origin)
-            point_db = ray.start_db - db_change
+            cells = self.grid.cell_ids(phit, face_idx)
+            self.grid.add_cells(cells, point_db, scales=rays.scales)
+            if self.echogram is not None:
+                self.echogram.add(
+                    cells, new_dist_from_origin, point_db, scales=rays.scales
+                )
+            if self.paths is not None:
+                depth = self.reflections - rNum
+                nodes = self.paths.add(
+                    parents, face_idx, cells, depth, db_change, weights
+                )
 
-            # Log Point
-            curr_point_db = self.point_dict.get((phit.x, phit.y, phit.z))
-            if curr_point_db is not None:
-                self.point_dict[(phit.x, phit.y, phit.z)] = sum_levels(
-                    [point_db, curr_point_db]
+            if rNum > 0 and len(face_idx) > 0:
+                # Calculate the reflected rays, leaving from the side of the
+                # surface the rays came from
+                normals = self.engine.normals[face_idx]
+                side = -np.sign((directions * normals).sum(axis=1))
+                reflected_db = point_db * (1 - self.absorption[face_idx])
+                reflections = self.reflect(
+                    directions,
+                    phit + normals * (side * SURFACE_OFFSET)[:, None],
+                    normals,
+                    reflected_db,
+                    new_dist_from_origin,
+                    self.kd[face_idx],
+                    self.ks[face_idx],
                 )
-            else:
-                self.point_dict[(phit.x, phit.y, phit.z)] = point_db
-
-            if rNum > 0:
-                # Calculate the reflected rays
-                reflected_db = point_db * (1 - mtl.absorption(face.material, self.freq))
-                reflections = generate_brdf(
-                    ray, phit, reflected_db, new_dist_from_origin, face
+                live, levels, survivors = terminate(
+                    reflections[3], self.cutoff, self.roulette
                 )
 
-                for ray in reflections:
-                    if ray.start_db > 0:
-                        self.intersect(ray, rNum - 1)
-
-            return True
-        return False
-
-    def is_inside(
-        self, point: Vec3, v0: Vec3, v1: Vec3, v2: Vec3, normal: Vec3
-    ) -> bool:
-        """
-        Determines if the point is inside the given triangle bounds and on the same plane
-        """
-        edge0 = v1.sub(v0)
-        edge1 = v2.sub(v1)
-        edge2 = v0.sub(v2)
-        C0 = point.sub(v0)
-        C1 = point.sub(v1)
-        C2 = point.sub(v2)
-
-        if (
-            normal.dot(edge0.cross(C0)) >= 0
-            and normal.dot(edge1.cross(C1)) >= 0
-            and normal.dot(edge2.cross(C2)) >= 0
-            and C0.dot(C1.cross(C2)) == 0.0
-        ):
-            return True
-        return False
+                # Node of the hit each reflected ray leaves from
+                per_hit = len(levels) // len(face_idx)
+                parents = np.repeat(np.arange(len(face_idx)), per_hit)
+                if self.paths is not None:
+                    parents = nodes[parents]
+
+                scales = np.repeat(rays.scales, per_hit, axis=0) * survivors
+                scales *= reflections[5][:, None]
+                rays = RayBatch(*reflections[:3], levels, scales)[live]
+                weights, parents = reflections[4][live], parents[live]
+
+                for start in reversed(range(0, len(rays), self.batch_size)):
+                    batch = slice(start, start + self.batch_size)
+                    queue.append(
+                        (rays[batch], weights[batch], parents[batch], rNum - 1)
+                    )
+
+        return success
+
+    def reflect(self, *hits) -> tuple:
+        """
+        Generates the reflected rays of the given hits, tracing the whole hemisphere
+        or, when `brdf_samples` is set, that many importance sampled rays per hit
+        """
+        if self.brdf_samples is None:
+            return generate_brdf(*hits)
+        return sample_brdf(*hits, samples=self.brdf_samples)
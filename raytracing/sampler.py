@@ -0,0 +1,70 @@
+import math
+from functools import lru_cache
+import numpy as np
+
+# Number of direction tables kept, one per ray count
+TABLE_CACHE = 16
+
+
+@lru_cache(maxsize=TABLE_CACHE)
+def fibonacci_sphere(count: int) -> np.ndarray:
+    """
+    Returns `count` unit directions spread evenly over the sphere along a
+    Fibonacci spiral\n
+    Tables are built once per count and shared, so they are read-only.
+    """
+    offset = 2.0 / count
+    increment = math.pi * (3.0 - math.sqrt(5.0))
+
+    i = np.arange(count)
+    y = ((i * offset) - 1) + (offset / 2)
+    r = np.sqrt(1 - y ** 2)
+    phi = i * increment
+
+    directions = np.stack([np.cos(phi) * r, y, np.sin(phi) * r], axis=1)
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    directions.flags.writeable = False
+    return directions
+
+
+def random_rotations(count: int) -> np.ndarray:
+    """
+    Returns `count` uniformly distributed random (3, 3) rotation matrices, built
+    from random unit quaternions
+    """
+    u1, u2, u3 = np.random.random((3, count))
+    a = np.sqrt(1 - u1)
+    b = np.sqrt(u1)
+    x, y = a * np.sin(2 * math.pi * u2), a * np.cos(2 * math.pi * u2)
+    z, w = b * np.sin(2 * math.pi * u3), b * np.cos(2 * math.pi * u3)
+
+    return np.stack(
+        [
+            [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+            [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+            [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+        ]
+    ).transpose(2, 0, 1)
+
+
+def sphere_directions(count: int) -> np.ndarray:
+    """
+    Returns the `count` directions of the Fibonacci sphere under one random
+    rotation
+    """
+    return fibonacci_sphere(count) @ random_rotations(1)[0].T
+
+
+def hemisphere_directions(normals: np.ndarray, valid_side, count: int) -> np.ndarray:
+    """
+    Returns (hits, count, 3) directions of the Fibonacci sphere under a random
+    rotation per hit, flipped onto the side of each normal given by the sign of
+    `valid_side`
+    """
+    v = fibonacci_sphere(count) @ random_rotations(len(normals)).transpose(0, 2, 1)
+
+    # Ensure that the rays are inside the object
+    side = np.einsum("hj,hkj->hk", normals, v)
+    flip = np.sign(side) != np.sign(valid_side)[:, None]
+    v[flip] = -v[flip]
+    return v
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class SharedArray(np.ndarray):
+    """
+    NumPy array backed by a block of shared memory\n
+    Pickling only sends the name of the block, the receiving process attaches to
+    the same memory instead of getting a copy. Arrays derived from a shared array
+    own no block and are pickled as regular arrays.
+    """
+
+    def __array_finalize__(self, obj):
+        self.block = None
+
+    def __reduce__(self):
+        if self.block is None:
+            return np.asarray(self).__reduce__()
+        return attach, (self.block.name, self.shape, self.dtype.str)
+
+
+def share(array: np.ndarray) -> SharedArray:
+    """
+    Copies the given array into a new block of shared memory\n
+    Shared memory needs Python 3.8, it is only imported once arrays are shared
+    for a parallel trace.
+    """
+    from multiprocessing import shared_memory
+
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    shared = np.ndarray(array.shape, array.dtype, buffer=block.buf).view(SharedArray)
+    shared[...] = array
+    shared.block = block
+    return shared
+
+
+def attach(name: str, shape: tuple, dtype: str) -> SharedArray:
+    """
+    Maps an existing block of shared memory as an array without copying it
+    """
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(name)
+    shared = np.ndarray(shape, np.dtype(dtype), buffer=block.buf).view(SharedArray)
+    shared.block = block
+    return shared
+
+
+def share_attributes(*objects) -> list:
+    """
+    Moves the array attributes of the given objects into shared memory.
+    Returns the replaced attributes so they can be restored by `unshare_attributes`.
+    """
+    replaced = []
+    for obj in objects:
+        for name, value in list(vars(obj).items()):
+            if isinstance(value, np.ndarray) and not isinstance(value, SharedArray):
+                replaced.append((obj, name, value))
+                setattr(obj, name, share(value))
+    return replaced
+
+
+def unshare_attributes(replaced: list):
+    """
+    Restores attributes moved by `share_attributes` and frees their shared memory
+    """
+    for obj, name, value in replaced:
+        block = getattr(obj, name).block
+        setattr(obj, name, value)
+        block.close()
+        block.unlink()